@@ -0,0 +1,478 @@
+"""Benchmarks for the detection pipeline.
+
+Builds synthetic buff columns from the real templates in images/ and compares
+the matching strategies in main.py against the exhaustive per-template path
+that detection_loop runs in standard mode. `stages` and `scaling` run the
+categories in settings.json (or copies of them) through the real
+DetectionEngine on a synthetic screen.
+
+Run from anywhere; paths are resolved relative to this file:
+
+    python benchmark.py pyramid --frames 200 --levels 1 2 --candidates 1 3 5
+    python benchmark.py batched --frames 200
+    python benchmark.py threads --templates 50 --threads 1 2 4 8
+    python benchmark.py stages --frames 200
+    python benchmark.py --json report.json scaling --categories 1 2 4 8 --debuffs 1 8 32
+    python benchmark.py render --icons 12 --changes 500
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+os.chdir(Path(__file__).resolve().parent) # main.py and the images/ folder use relative paths
+import main
+
+THRESHOLD = 0.8
+
+# --- Synthetic frames ---
+def load_templates(max_width=22):
+    """(name, gray template, BGR image) for every debuff in debuffs.json that fits a buff slot."""
+    with open('debuffs.json') as f:
+        debuffs = json.load(f)
+    templates = []
+    for debuff in debuffs:
+        gray = main.template_bank.get(debuff['detect_image'])
+        color = cv2.imread(f"images/{debuff['detect_image']}", cv2.IMREAD_COLOR)
+        if gray is None or color is None or gray.shape[1] > max_width:
+            continue
+        templates.append((debuff['name'], gray, color))
+    return templates
+
+def synthetic_column(rng, templates, present, height=903, width=25, pitch=26, top=10):
+    """Returns an RGB frame shaped like our buff strip with the present templates in slots.
+
+    Each slot gets a blurred noise icon with the template pasted near its top-left
+    corner. The template's BGR pixels are stored as-is because detection converts
+    frames with COLOR_BGR2GRAY, so the gray frame reproduces the template exactly.
+    """
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = rng.integers(10, 50)
+    frame += rng.integers(0, 6, frame.shape, dtype=np.uint8)
+    for slot, index in enumerate(present):
+        y = top + slot * pitch
+        if y + pitch > height:
+            break
+        icon = rng.integers(40, 220, (pitch - 2, min(24, width), 3), dtype=np.uint8)
+        frame[y:y + pitch - 2, :icon.shape[1]] = cv2.GaussianBlur(icon, (3, 3), 0)
+        color = templates[index][2]
+        x = max(0, min(3, width - color.shape[1])) # Narrow columns (24 px) still fit the widest icons
+        frame[y + 2:y + 2 + color.shape[0], x:x + color.shape[1]] = color
+    return frame
+
+def synthetic_frames(templates, count, seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        present = rng.permutation(len(templates))[:rng.integers(0, len(templates) + 1)]
+        frames.append(synthetic_column(rng, templates, present, **kwargs))
+    return frames
+
+class SyntheticCaptureBackend(main.FileCaptureBackend):
+    """Capture stand-in: serves prebuilt screen canvases the way the file backend serves images."""
+    name = 'synthetic'
+
+    def __init__(self, canvases, origin):
+        main.CaptureBackend.__init__(self)
+        self.frames = canvases
+        self.origin = origin
+        self.loop = True
+        self.index = -1
+
+def synthetic_screen(templates, categories, count, seed=0):
+    """Screen canvases covering every category's search and anchor rect, and their origin.
+
+    Each search rect gets a synthetic buff column holding a random subset of the
+    templates, and the anchor image is drawn at the top-left of each anchor rect.
+    Overlapping categories watch the same column, as they do in settings.json.
+    """
+    rng = np.random.default_rng(seed)
+    anchors = {}
+    rects = []
+    for category in categories:
+        rects.append((category['x'], category['y'], category['width'], category['height']))
+        if category.get('anchor_detection_enabled') and category.get('anchor_image'):
+            rects.append((category['anchor_x'], category['anchor_y'], category['anchor_width'], category['anchor_height']))
+            anchors[rects[-1]] = cv2.imread(f"images/{category['anchor_image']}", cv2.IMREAD_COLOR)
+    x0, y0 = min(r[0] for r in rects), min(r[1] for r in rects)
+    width = max(r[0] + r[2] for r in rects) - x0
+    height = max(r[1] + r[3] for r in rects) - y0
+    canvases = []
+    for _ in range(count):
+        canvas = rng.integers(10, 50, (height, width, 3), dtype=np.uint8)
+        for x, y, w, h in sorted({(c['x'], c['y'], c['width'], c['height']) for c in categories}):
+            present = rng.permutation(len(templates))[:rng.integers(0, len(templates) + 1)]
+            canvas[y - y0:y - y0 + h, x - x0:x - x0 + w] = synthetic_column(rng, templates, present, height=h, width=w)
+        for (x, y, w, h), anchor in anchors.items():
+            if anchor is not None and anchor.shape[0] <= h and anchor.shape[1] <= w:
+                canvas[y - y0:y - y0 + anchor.shape[0], x - x0:x - x0 + anchor.shape[1]] = anchor
+        canvases.append(canvas)
+    return canvases, (x0, y0)
+
+def load_categories():
+    """(settings.json categories, debuffs.json) with each category's selected debuffs resolved."""
+    with open('settings.json') as f:
+        settings = json.load(f)
+    with open('debuffs.json') as f:
+        debuffs = json.load(f)
+    return [(c, main.category_debuffs(c, debuffs)) for c in settings.get('categories', [])], debuffs
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    return {'mean_ms': round(sum(samples) / len(samples), 4),
+            'p50_ms': round(samples[len(samples) // 2], 4),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 4),
+            'max_ms': round(samples[-1], 4)}
+
+# --- Reference path ---
+def exhaustive_scores(gray, templates):
+    """What standard-mode detection_loop does: one full matchTemplate per debuff."""
+    scores = {}
+    for name, template in templates:
+        if template.shape[0] > gray.shape[0] or template.shape[1] > gray.shape[1]:
+            continue
+        res = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        scores[name] = cv2.minMaxLoc(res)[1]
+    return scores
+
+def time_matcher(match, grays, templates, repeat):
+    """Best-of-repeat mean milliseconds per frame, plus the scores of the last run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [match(gray, templates) for gray in grays]
+        best = min(best, (time.perf_counter() - start) * 1000.0 / len(grays))
+    return best, results
+
+def agreement(reference, candidate):
+    """Fraction of (frame, template) pairs with the same detected state, and the worst score error on hits."""
+    same = total = 0
+    hit_error = 0.0
+    for ref_scores, scores in zip(reference, candidate):
+        for name, ref in ref_scores.items():
+            value = scores.get(name, -1.0)
+            total += 1
+            same += (ref >= THRESHOLD) == (value >= THRESHOLD)
+            if ref >= THRESHOLD:
+                hit_error = max(hit_error, abs(ref - value))
+    return (same / total if total else 1.0), hit_error
+
+# --- Benchmarks ---
+def bench_pyramid(args):
+    templates = load_templates()
+    pairs = [(name, gray) for name, gray, _ in templates]
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in synthetic_frames(templates, args.frames, args.seed)]
+
+    base_ms, reference = time_matcher(exhaustive_scores, grays, pairs, args.repeat)
+    rows = [{'mode': 'exhaustive', 'levels': 0, 'candidates': 0, 'ms_per_frame': round(base_ms, 3),
+             'speedup': 1.0, 'state_agreement': 1.0, 'max_hit_error': 0.0}]
+    for levels in args.levels:
+        for candidates in args.candidates:
+            matcher = main.PyramidMatcher(levels=levels, candidates=candidates)
+            ms, results = time_matcher(matcher.match, grays, pairs, args.repeat)
+            state_agreement, hit_error = agreement(reference, results)
+            rows.append({'mode': 'pyramid', 'levels': levels, 'candidates': candidates,
+                         'ms_per_frame': round(ms, 3), 'speedup': round(base_ms / ms, 2),
+                         'state_agreement': round(state_agreement, 4), 'max_hit_error': round(hit_error, 5)})
+    return {'benchmark': 'pyramid', 'frames': args.frames, 'templates': len(pairs),
+            'frame_shape': list(grays[0].shape), 'results': rows}
+
+def bench_batched(args):
+    """BatchedMatcher vs exhaustive matchTemplate; fails if any score is off by more than its TOLERANCE."""
+    templates = load_templates()
+    pairs = [(name, gray) for name, gray, _ in templates]
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in synthetic_frames(templates, args.frames, args.seed)]
+
+    base_ms, reference = time_matcher(exhaustive_scores, grays, pairs, args.repeat)
+    ms, results = time_matcher(main.BatchedMatcher().match, grays, pairs, args.repeat)
+    state_agreement, _ = agreement(reference, results)
+    # Every score, not just hits: the contract is the same max scores as the per-template path
+    score_error = max((abs(ref - scores.get(name, float('inf')))
+                       for ref_scores, scores in zip(reference, results) for name, ref in ref_scores.items()),
+                      default=0.0)
+    passed = score_error <= main.BatchedMatcher.TOLERANCE and state_agreement == 1.0
+    rows = [{'mode': 'exhaustive', 'ms_per_frame': round(base_ms, 3), 'speedup': 1.0, 'state_agreement': 1.0,
+             'max_score_error': 0.0},
+            {'mode': 'batched', 'ms_per_frame': round(ms, 3), 'speedup': round(base_ms / ms, 2),
+             'state_agreement': round(state_agreement, 4), 'max_score_error': float(f"{score_error:.2e}")}]
+    return {'benchmark': 'batched', 'frames': args.frames, 'templates': len(pairs),
+            'frame_shape': list(grays[0].shape), 'tolerance': main.BatchedMatcher.TOLERANCE,
+            'passed': passed, 'results': rows}
+
+def synthetic_debuffs(templates, count):
+    """count debuff definitions cycling through the templates, with unique names."""
+    with open('debuffs.json') as f:
+        images = {d['name']: d['detect_image'] for d in json.load(f)}
+    return [{'name': f"{templates[i % len(templates)][0]} #{i}", 'detect_image': images[templates[i % len(templates)][0]]}
+            for i in range(count)]
+
+def signal_receiver():
+    """A QObject whose changed(DetectionDiff) signal is queued like CategoryWindow's, and the app to deliver it."""
+    from PyQt5.QtCore import QCoreApplication, QObject, pyqtSignal, Qt
+
+    class Receiver(QObject):
+        changed = pyqtSignal(object)
+
+        def __init__(self):
+            super().__init__()
+            self.received = 0
+            self.changed.connect(self.on_changed, Qt.QueuedConnection)
+
+        def on_changed(self, diff):
+            self.received += 1
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    return app, Receiver()
+
+def bench_stages(args):
+    """Time spent in each stage of a tick for the categories in settings.json."""
+    categories, _ = load_categories()
+    templates = load_templates()
+    canvases, origin = synthetic_screen(templates, [c for c, _ in categories], args.frames, args.seed)
+    capture_service = main.CaptureService(SyntheticCaptureBackend(canvases, origin))
+    resolver = main.AnchorResolver(main.template_bank)
+    engines = [main.DetectionEngine(config, debuffs, capture_service, resolver) for config, debuffs in categories]
+    app, receiver = signal_receiver()
+    for engine in engines:
+        engine.subscribe(receiver.changed.emit)
+
+    samples = {}
+    def timed(stage, scope, start, divisor=1):
+        samples.setdefault((stage, scope), []).append((time.perf_counter() - start) * 1000.0 / max(divisor, 1))
+
+    for index in range(args.frames):
+        start = time.perf_counter()
+        frame = capture_service.get_frame(max_age=0)
+        timed('capture', 'frame', start)
+        frame = main.CapturedFrame(float(index), frame.regions) # One second apart, so every debuff is due
+        start = time.perf_counter()
+        resolver.resolve(frame, engines[0]) # Evaluates every anchor group once
+        timed('anchor', 'frame', start)
+        for engine in engines:
+            view = frame.view(engine.screen_region)
+            start = time.perf_counter()
+            cv2.cvtColor(view, cv2.COLOR_BGR2GRAY)
+            timed('grayscale', engine.category_name, start)
+            due = set(engine.poll_intervals)
+            start = time.perf_counter()
+            states = engine.matcher.detect(view, due)
+            timed('match', engine.category_name, start)
+            timed('match_per_template', engine.category_name, start, len(due))
+            start = time.perf_counter()
+            changes = main.diff_detection_states(engine.last_detection_state, states)
+            timed('state_diff', engine.category_name, start)
+            start = time.perf_counter()
+            engine.apply_detection_changes(changes, frame.timestamp) # One diff per tick
+            app.processEvents() # Delivery on the GUI thread
+            timed('signal', engine.category_name, start)
+    for engine in engines:
+        engine.stop()
+
+    rows = [{'stage': stage, 'scope': scope, **percentiles(values)} for (stage, scope), values in samples.items()]
+    return {'benchmark': 'stages', 'frames': args.frames, 'categories': len(engines),
+            'frame_shape': list(canvases[0].shape[:2]), 'signals': receiver.received, 'results': rows}
+
+def bench_scaling(args):
+    """Whole-tick latency with 1..N categories watching 1..M debuffs each, through DetectionEngine."""
+    categories, _ = load_categories()
+    base = categories[0][0] if categories else {'x': 0, 'y': 0, 'width': 25, 'height': 903}
+    templates = load_templates()
+    app, receiver = signal_receiver()
+    rows = []
+    for category_count in args.categories:
+        for debuff_count in args.debuffs:
+            debuffs = synthetic_debuffs(templates, debuff_count)
+            configs = []
+            for i in range(category_count):
+                shift = i * (base['width'] + 40) # Separate grab groups, like categories on different bars
+                config = dict(base, name=f"Category {i}", selected_debuffs=[d['name'] for d in debuffs],
+                              poll_intervals_ms={}, x=base['x'] + shift)
+                if base.get('anchor_detection_enabled'):
+                    config['anchor_x'] = base['anchor_x'] + shift
+                configs.append(config)
+            canvases, origin = synthetic_screen(templates, configs, args.frames, args.seed)
+            capture_service = main.CaptureService(SyntheticCaptureBackend(canvases, origin))
+            resolver = main.AnchorResolver(main.template_bank)
+            engines = []
+            for config in configs:
+                engine = main.DetectionEngine(config, debuffs, capture_service, resolver)
+                engine.subscribe(receiver.changed.emit)
+                engines.append(engine)
+
+            ticks = []
+            for index in range(args.frames):
+                start = time.perf_counter()
+                frame = capture_service.get_frame(max_age=0)
+                frame = main.CapturedFrame(float(index), frame.regions)
+                for engine in engines:
+                    engine.process_frame(frame)
+                app.processEvents()
+                ticks.append((time.perf_counter() - start) * 1000.0)
+            for engine in engines:
+                engine.stop()
+            stats = percentiles(ticks[1:] or ticks) # The first tick loads templates from disk
+            rows.append({'categories': category_count, 'debuffs': debuff_count, **stats,
+                         'us_per_template': round(stats['mean_ms'] * 1000.0 / (category_count * debuff_count), 1),
+                         'max_hz': round(1000.0 / stats['mean_ms'], 1) if stats['mean_ms'] else 0.0})
+    return {'benchmark': 'scaling', 'frames': args.frames, 'frame_shape': [base['height'], base['width']],
+            'results': rows}
+
+def bench_render(args):
+    """GUI-thread time per detection change (update plus repaint) for each renderer and display mode.
+
+    Real CategoryWindows without detection, shown on screen (or on the platform
+    QT_QPA_PLATFORM names). Each change flips a random icon's state through
+    handle_debuff_update, then the event loop runs until it is painted.
+    """
+    from types import SimpleNamespace
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    with open('debuffs.json') as f:
+        available = [d for d in json.load(f) if d.get('icon_image')]
+    debuffs = [dict(available[i % len(available)], name=f"{available[i % len(available)]['name']} #{i}")
+               for i in range(args.icons)]
+    # Just what CategoryWindow reads from its DebuffTracker; no scheduler, so nothing is detected
+    host = SimpleNamespace(global_settings={}, capture_service=main.CaptureService(), debuffs=debuffs,
+                           anchor_resolver=main.AnchorResolver(main.template_bank), detection_scheduler=None,
+                           worker_pool=None, latency_tracer=main.LatencyTracer())
+    rng = np.random.default_rng(args.seed)
+    flips = rng.integers(0, len(debuffs), args.changes)
+    rows = []
+    for display_mode in args.modes:
+        for renderer in args.renderers:
+            config = {'name': f"{renderer} {display_mode}", 'x': 0, 'y': 0, 'width': 25, 'height': 903,
+                      'window_x': 100, 'window_y': 100, 'icon_size': args.size, 'layout': args.layout,
+                      'display_mode': display_mode, 'renderer': renderer, 'selected_debuffs': [d['name'] for d in debuffs]}
+            window = main.CategoryWindow(config, debuffs, host)
+            window.show()
+            states = {}
+            for d in debuffs: # Every icon on screen before timing
+                states[d['name']] = display_mode == 'invert'
+                window.handle_debuff_update(d['name'], states[d['name']], None)
+            app.processEvents()
+            samples = []
+            for index in flips:
+                name = debuffs[index]['name']
+                states[name] = not states[name]
+                start = time.perf_counter()
+                window.handle_debuff_update(name, states[name], None)
+                app.processEvents() # Layout, paint and flush
+                samples.append((time.perf_counter() - start) * 1000.0)
+            window.close()
+            window.deleteLater()
+            app.processEvents()
+            rows.append({'display_mode': display_mode, 'renderer': renderer, **percentiles(samples)})
+    return {'benchmark': 'render', 'icons': len(debuffs), 'changes': args.changes, 'icon_size': args.size,
+            'layout': args.layout, 'platform': app.platformName(), 'results': rows}
+
+def bench_threads(args):
+    """Per-frame latency of one standard-mode category with args.templates debuffs by match_threads."""
+    templates = load_templates()
+    debuffs = synthetic_debuffs(templates, args.templates)
+    due = {d['name'] for d in debuffs}
+    # Fresh frames every repeat so the change gate can't reuse any scores
+    frames = synthetic_frames(templates, args.frames * args.repeat, args.seed)
+    config = {'name': 'Benchmark', 'selected_debuffs': sorted(due), 'match_mode': 'standard'}
+
+    rows, reference = [], None
+    for threads in args.threads:
+        matcher = main.CategoryMatcher(config, debuffs, threshold=THRESHOLD, match_threads=threads)
+        best, states = float('inf'), []
+        for run in range(args.repeat):
+            batch = frames[run * args.frames:(run + 1) * args.frames]
+            start = time.perf_counter()
+            states = [matcher.detect(frame, due) for frame in batch]
+            best = min(best, (time.perf_counter() - start) * 1000.0 / len(batch))
+        matcher.close() # Hands OpenCV its own thread count back before the next run
+        if reference is None:
+            reference, base_ms = states, best
+        same = sum(a == b for a, b in zip(reference, states)) / len(states)
+        rows.append({'threads': threads, 'ms_per_frame': round(best, 3), 'speedup': round(base_ms / best, 2),
+                     'state_agreement': round(same, 4)})
+    return {'benchmark': 'threads', 'frames': args.frames, 'templates': len(debuffs),
+            'frame_shape': list(frames[0].shape[:2]), 'cpu_count': os.cpu_count(), 'results': rows}
+
+def print_rows(report):
+    rows = report['results']
+    columns = list(rows[0].keys())
+    details = ', '.join(f"{key} {value}" for key, value in report.items() if key not in ('benchmark', 'results', 'environment'))
+    print(f"{report['benchmark']}: {details}")
+    print('  '.join(f"{c:>15}" for c in columns))
+    for row in rows:
+        print('  '.join(f"{str(row[c]):>15}" for c in columns))
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Detection pipeline benchmarks")
+    parser.add_argument('--json', help="Also write the report to this file")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    pyramid = subparsers.add_parser('pyramid', help="Pyramid matching vs exhaustive matchTemplate")
+    pyramid.add_argument('--frames', type=int, default=200)
+    pyramid.add_argument('--repeat', type=int, default=3)
+    pyramid.add_argument('--seed', type=int, default=0)
+    pyramid.add_argument('--levels', type=int, nargs='+', default=[1, 2])
+    pyramid.add_argument('--candidates', type=int, nargs='+', default=[1, 3, 5])
+    pyramid.set_defaults(run=bench_pyramid)
+
+    batched = subparsers.add_parser('batched', help="Batched matching vs exhaustive matchTemplate, checks TOLERANCE")
+    batched.add_argument('--frames', type=int, default=200)
+    batched.add_argument('--repeat', type=int, default=1)
+    batched.add_argument('--seed', type=int, default=0)
+    batched.set_defaults(run=bench_batched)
+
+    threads = subparsers.add_parser('threads', help="Latency of one large category by match_threads")
+    threads.add_argument('--frames', type=int, default=100)
+    threads.add_argument('--repeat', type=int, default=3)
+    threads.add_argument('--seed', type=int, default=0)
+    threads.add_argument('--templates', type=int, default=50)
+    threads.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    threads.set_defaults(run=bench_threads)
+
+    stages = subparsers.add_parser('stages', help="Time per tick stage for the categories in settings.json")
+    stages.add_argument('--frames', type=int, default=200)
+    stages.add_argument('--seed', type=int, default=0)
+    stages.set_defaults(run=bench_stages)
+
+    scaling = subparsers.add_parser('scaling', help="Tick latency by number of categories and debuffs")
+    scaling.add_argument('--frames', type=int, default=50)
+    scaling.add_argument('--seed', type=int, default=0)
+    scaling.add_argument('--categories', type=int, nargs='+', default=[1, 2, 4, 8])
+    scaling.add_argument('--debuffs', type=int, nargs='+', default=[1, 4, 16, 32])
+    scaling.set_defaults(run=bench_scaling)
+
+    render = subparsers.add_parser('render', help="Repaint time per detection change by renderer")
+    render.add_argument('--icons', type=int, default=12)
+    render.add_argument('--changes', type=int, default=500)
+    render.add_argument('--size', type=int, default=48)
+    render.add_argument('--layout', choices=['vertical', 'horizontal'], default='vertical')
+    render.add_argument('--seed', type=int, default=0)
+    render.add_argument('--modes', nargs='+', choices=['default', 'invert', 'opacity'], default=['opacity', 'default'])
+    render.add_argument('--renderers', nargs='+', choices=['widgets', 'strip'], default=['widgets', 'strip'])
+    render.set_defaults(run=bench_render)
+
+    args = parser.parse_args()
+    report = args.run(args)
+    # Enough context to compare reports from different releases or machines
+    report['environment'] = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                             'numpy': np.__version__, 'opencv': cv2.__version__, 'cpu_count': os.cpu_count(),
+                             'platform': platform.platform()}
+    print_rows(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report.get('passed') is False:
+        print(f"FAILED: scores differ from the per-template path by more than {report['tolerance']}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,11 +1,22 @@
+import os
 import sys
 import json
+import math
 import time
+import bisect
 import threading
+import queue
+import signal
+from collections import OrderedDict, deque, namedtuple
+from types import MappingProxyType
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from PIL import ImageGrab
 import cv2
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QRect, QSettings, QEvent
+from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QRect, QSettings, QEvent, QTimer, QFileSystemWatcher
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel,
                              QHBoxLayout, QSystemTrayIcon, QMenu, QAction, 
                              QToolButton, QBoxLayout, QSizePolicy, QSlider, 
@@ -13,10 +24,2770 @@ from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel,
                              QListWidget, QListWidgetItem, QDialogButtonBox, 
                              QPushButton, QDesktopWidget, QLineEdit, QMessageBox) # Added QGraphicsOpacityEffect
 from PyQt5.QtGui import (QColor, QPixmap, QPainter, QBrush, QCursor,
-                         QIcon, QGuiApplication)
+                         QIcon, QGuiApplication, QFont, QPen)
 from pathlib import Path
 
-# --- RegionSelector Class (Unchanged) ---
+IMAGES_DIR = Path("images")
+
+# --- TemplateBank Class ---
+class TemplateBank:
+    """Process-wide cache of grayscale detection templates.
+
+    Every template is decoded once and shared by all DetectionEngines. An entry is
+    only re-read from disk when the file's mtime or size changes; the file is
+    stat'ed at most once per stat_interval seconds.
+    """
+    def __init__(self, image_dir=IMAGES_DIR, stat_interval=1.0):
+        self.image_dir = Path(image_dir)
+        self.stat_interval = stat_interval
+        self._entries = {} # filename -> {'template', 'signature', 'checked'}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, filename):
+        """Returns the grayscale template for filename, or None if it can't be loaded."""
+        if not filename:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and now - entry['checked'] < self.stat_interval:
+                self.hits += 1
+                return entry['template']
+
+        path = self.image_dir / filename
+        try:
+            stat = path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None # Missing file is cached too, so we don't retry imread every tick
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry['signature'] == signature:
+                entry['checked'] = now
+                self.hits += 1
+                return entry['template']
+
+        # Decode outside the lock so other threads can keep hitting the cache
+        template = None
+        if signature is not None:
+            template = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if template is not None:
+                template = np.ascontiguousarray(template)
+                template.setflags(write=False) # Shared between threads, never modify in place
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            self._entries[filename] = {'template': template, 'signature': signature, 'checked': now}
+        return template
+
+    def invalidate(self, filename=None):
+        """Drops one entry (or all entries) so the next get() decodes from disk."""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filename, None)
+
+    def stats(self):
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+            }
+
+template_bank = TemplateBank()
+
+# --- Screen Capture Service ---
+def rect_tuple(rect):
+    """Converts a QRect to a plain (x, y, width, height) tuple usable off the GUI thread."""
+    return (rect.x(), rect.y(), rect.width(), rect.height())
+
+def rect_union(a, b):
+    """Bounding box of two (x, y, width, height) rects."""
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1 = max(a[0] + a[2], b[0] + b[2])
+    y1 = max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def rect_contains(outer, inner):
+    """True if rect inner lies completely inside rect outer."""
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and
+            inner[1] + inner[3] <= outer[1] + outer[3])
+
+# --- Capture Backends ---
+class CaptureBackend:
+    """Grabs screen rects as RGB uint8 arrays of shape (height, width, 3).
+
+    Subclasses implement _grab(); grab() wraps it with latency bookkeeping.
+    """
+    name = 'base'
+
+    def __init__(self):
+        self.grab_count = 0
+        self.last_latency_ms = 0.0
+        self.avg_latency_ms = 0.0 # Exponential moving average
+        self.max_latency_ms = 0.0
+
+    def grab(self, rect):
+        start = time.perf_counter()
+        image = self._grab(rect)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self.grab_count += 1
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        if self.grab_count == 1:
+            self.avg_latency_ms = latency_ms
+        else:
+            self.avg_latency_ms += (latency_ms - self.avg_latency_ms) * 0.1
+        return image
+
+    def _grab(self, rect):
+        raise NotImplementedError
+
+    def next_frame(self):
+        """Called once per tick before the groups are grabbed. Only replay backends care."""
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'grabs': self.grab_count,
+            'last_ms': round(self.last_latency_ms, 3),
+            'avg_ms': round(self.avg_latency_ms, 3),
+            'max_ms': round(self.max_latency_ms, 3),
+        }
+
+class PILCaptureBackend(CaptureBackend):
+    """The original PIL.ImageGrab path. Works everywhere PIL can grab, but allocates twice per grab."""
+    name = 'pil'
+
+    def _grab(self, rect):
+        bbox = (rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3])
+        return np.array(ImageGrab.grab(bbox=bbox))
+
+class MSSCaptureBackend(CaptureBackend):
+    """Fast path through the optional mss package (X11 on Linux, GDI BitBlt on Windows).
+
+    The BGRA pixels mss returns are converted straight into a reusable NumPy buffer.
+    Buffers are kept in a small ring per rect so a frame still being matched by a
+    slow category is not overwritten by the next tick's grab.
+    """
+    name = 'mss'
+    ring_size = 3
+
+    def __init__(self):
+        super().__init__()
+        import mss # Optional dependency, create_capture_backend() falls back to PIL without it
+        mss.mss().close() # Fail here rather than on the first grab if there is no display
+        self._mss_module = mss
+        self._local = threading.local() # mss handles are not thread-safe
+        self._buffers = {} # rect -> [ring of arrays, next index]
+
+    def _grab(self, rect):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = self._mss_module.mss()
+        shot = sct.grab({'left': rect[0], 'top': rect[1], 'width': rect[2], 'height': rect[3]})
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+        ring = self._buffers.get(rect)
+        if ring is None or ring[0][0].shape[:2] != bgra.shape[:2]:
+            ring = self._buffers[rect] = [[np.empty((shot.height, shot.width, 3), np.uint8)
+                                           for _ in range(self.ring_size)], 0]
+        buffer = ring[0][ring[1]]
+        ring[1] = (ring[1] + 1) % self.ring_size
+        buffer.setflags(write=True)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=buffer)
+        return buffer
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+
+class FileCaptureBackend(CaptureBackend):
+    """Serves frames from image files instead of the screen, for headless runs and tests.
+
+    source is an image file or a directory of images; each tick advances to the
+    next file. origin is the screen position of the image's top-left corner, so the
+    category rects in settings.json can be used unchanged.
+    """
+    name = 'file'
+
+    def __init__(self, source, origin=(0, 0), loop=True):
+        super().__init__()
+        source = Path(source)
+        if source.is_dir():
+            paths = sorted(p for p in source.iterdir() if p.suffix.lower() in ('.png', '.bmp', '.jpg', '.jpeg'))
+        else:
+            paths = [source]
+        self.frames = []
+        for path in paths:
+            image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if image is None:
+                print(f"Warning: Could not read capture frame {path}")
+                continue
+            self.frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) # Same channel order as a screen grab
+        if not self.frames:
+            raise FileNotFoundError(f"No capture frames found at {source}")
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.loop = loop
+        self.index = -1
+
+    def next_frame(self):
+        if self.loop:
+            self.index = (self.index + 1) % len(self.frames)
+        else:
+            self.index = min(self.index + 1, len(self.frames) - 1)
+
+    def _grab(self, rect):
+        image = self.frames[max(self.index, 0)]
+        x, y = rect[0] - self.origin[0], rect[1] - self.origin[1]
+        out = np.zeros((rect[3], rect[2], 3), np.uint8) # Anything outside the image reads as black
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + rect[2], image.shape[1]), min(y + rect[3], image.shape[0])
+        if x1 > x0 and y1 > y0:
+            out[y0 - y:y1 - y, x0 - x:x1 - x] = image[y0:y1, x0:x1]
+        return out
+
+# --- Frame Recording ---
+class FrameRecorder:
+    """Appends every captured frame to a recording directory for later replay.
+
+    Layout: index.json lists segments; a new segment starts whenever the grab
+    groups (rects or shapes) change. Each segment has one raw uint8 file per group
+    rect with its frames back to back, and a float64 file of frame timestamps.
+    Frames are only ever appended, and readers count them from the file sizes,
+    so a recording cut short by a crash still replays.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segments = [] # [{'rects', 'shapes'}] as written to index.json
+        self._files = [] # open files of the current segment: timestamps first, then one per rect
+        self._layout = None
+        self._start = None # Timestamps are stored relative to the first frame
+        self.frames = 0
+        self.bytes = 0
+
+    def write(self, frame):
+        layout = tuple((rect, image.shape) for rect, image in frame.regions)
+        if layout != self._layout:
+            self._start_segment(layout)
+        if self._start is None:
+            self._start = frame.timestamp
+        np.array([frame.timestamp - self._start], np.float64).tofile(self._files[0])
+        for (_, image), f in zip(frame.regions, self._files[1:]):
+            np.ascontiguousarray(image).tofile(f)
+            self.bytes += image.nbytes
+        self.frames += 1
+
+    def _start_segment(self, layout):
+        self._close_files()
+        segment = len(self.segments)
+        self.segments.append({'rects': [list(rect) for rect, _ in layout],
+                              'shapes': [list(shape) for _, shape in layout]})
+        self._files = [open(self.path / f"seg{segment}.time", 'ab')]
+        self._files += [open(self.path / f"seg{segment}_{i}.u8", 'ab') for i in range(len(layout))]
+        self._layout = layout
+        with open(self.path / 'index.json', 'w') as f:
+            json.dump({'version': 1, 'segments': self.segments}, f, indent=2)
+
+    def _close_files(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def close(self):
+        self._close_files()
+
+class FrameRecording:
+    """Read side of a FrameRecorder directory; frames are memory-mapped, not loaded."""
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'index.json') as f:
+            index = json.load(f)
+        self.segments = []
+        for number, segment in enumerate(index['segments']):
+            timestamps = np.fromfile(self.path / f"seg{number}.time", np.float64)
+            rects = [tuple(rect) for rect in segment['rects']]
+            arrays = []
+            for i, shape in enumerate(segment['shapes']):
+                data = self.path / f"seg{number}_{i}.u8"
+                frame_size = int(np.prod(shape))
+                count = data.stat().st_size // frame_size if frame_size else 0
+                arrays.append(np.memmap(data, np.uint8, 'r', shape=(count, *shape)) if count else None)
+            count = min([len(timestamps)] + [len(a) if a is not None else 0 for a in arrays])
+            if count:
+                self.segments.append((timestamps[:count], rects, arrays))
+        self.frame_count = sum(len(timestamps) for timestamps, _, _ in self.segments)
+        if not self.frame_count:
+            raise FileNotFoundError(f"No recorded frames in {self.path}")
+
+    def frame(self, index):
+        """(timestamp, [((x, y, w, h), image)]) of frame index, counting across segments."""
+        for timestamps, rects, arrays in self.segments:
+            if index < len(timestamps):
+                return float(timestamps[index]), [(rect, array[index]) for rect, array in zip(rects, arrays)]
+            index -= len(timestamps)
+        raise IndexError(index)
+
+class ReplayCaptureBackend(CaptureBackend):
+    """Serves the frames of a FrameRecorder recording in order, one per tick.
+
+    A grab is answered from the recorded group that covers its rect, so with the
+    category rects used while recording every view is bit-identical to the
+    original. `timestamp` is the current frame's recorded time.
+    """
+    name = 'replay'
+
+    def __init__(self, path, loop=True):
+        super().__init__()
+        self.recording = FrameRecording(path)
+        self.loop = loop
+        self.index = -1
+        self.timestamp = 0.0
+        self._regions = []
+
+    def next_frame(self):
+        if self.loop:
+            self.index = (self.index + 1) % self.recording.frame_count
+        else:
+            self.index = min(self.index + 1, self.recording.frame_count - 1)
+        self.timestamp, self._regions = self.recording.frame(self.index)
+
+    def _grab(self, rect):
+        for group_rect, image in self._regions:
+            if rect_contains(group_rect, rect):
+                x, y = rect[0] - group_rect[0], rect[1] - group_rect[1]
+                return np.array(image[y:y + rect[3], x:x + rect[2]])
+        print(f"Warning: Rect {rect} was not recorded, replaying black.")
+        return np.zeros((rect[3], rect[2], 3), np.uint8)
+
+CAPTURE_BACKENDS = ('auto', 'mss', 'pil', 'file', 'replay')
+
+def create_capture_backend(settings):
+    """Builds the capture backend named by settings['capture_backend'].
+
+    'auto' prefers mss and falls back to PIL; a backend that fails to start also
+    falls back to PIL so detection keeps working.
+    """
+    name = str(settings.get('capture_backend', 'pil')).lower()
+    if name not in CAPTURE_BACKENDS:
+        print(f"Warning: Unknown capture_backend '{name}', using PIL.")
+        name = 'pil'
+    try:
+        if name in ('auto', 'mss'):
+            return MSSCaptureBackend()
+        if name == 'file':
+            return FileCaptureBackend(settings.get('capture_source', 'frames'),
+                                      settings.get('capture_origin', (0, 0)))
+        if name == 'replay':
+            return ReplayCaptureBackend(settings.get('capture_source', 'recordings'))
+    except Exception as e:
+        if name != 'auto':
+            print(f"Capture backend '{name}' unavailable ({e}), using PIL.")
+    return PILCaptureBackend()
+
+class CapturedFrame:
+    """One screen grab shared by every category for a tick.
+
+    Holds one array per grabbed group rect; view() hands out zero-copy slices.
+    """
+    def __init__(self, timestamp, regions, grab_ms=0.0):
+        self.timestamp = timestamp # time.monotonic() of the grab
+        self.regions = regions # list of ((x, y, w, h), np.ndarray)
+        self.grab_ms = grab_ms # Time the grab took, shared by every category reading the frame
+
+    def view(self, rect):
+        """Returns a read-only view of rect, or None if this frame doesn't cover it."""
+        if rect[2] <= 0 or rect[3] <= 0:
+            return None
+        for group_rect, image in self.regions:
+            if rect_contains(group_rect, rect):
+                x = rect[0] - group_rect[0]
+                y = rect[1] - group_rect[1]
+                return image[y:y + rect[3], x:x + rect[2]]
+        return None
+
+class CaptureService:
+    """Grabs the union of every registered search/anchor rect once per tick.
+
+    Owned by DebuffTracker. Category threads call get_frame(); the first caller in a
+    tick does the grab and everyone else reuses it until it is max_age seconds old.
+    Rects that are far apart are grabbed as separate groups instead of one huge bbox.
+    """
+    def __init__(self, backend=None, max_age=0.2, merge_slack=1.5):
+        self.backend = backend or PILCaptureBackend()
+        self.max_age = max_age
+        self.merge_slack = merge_slack # Max union area relative to the summed rect areas
+        self._regions = {} # owner -> list of (x, y, w, h)
+        self._groups = []
+        self._frame = None
+        self._lock = threading.Lock()
+        self.grab_count = 0
+        self.frame_count = 0
+        self.recorder = None # FrameRecorder every captured frame is appended to
+
+    def set_regions(self, owner, rects):
+        """Registers the rects an owner (a DetectionEngine) wants in every frame."""
+        with self._lock:
+            self._regions[owner] = [r for r in rects if r[2] > 0 and r[3] > 0]
+            self._groups = self._merge_regions()
+            self._frame = None # Next get_frame() must cover the new rects
+
+    def remove(self, owner):
+        with self._lock:
+            if self._regions.pop(owner, None) is not None:
+                self._groups = self._merge_regions()
+                self._frame = None
+
+    def _merge_regions(self):
+        """Greedily merges registered rects into as few grab groups as possible."""
+        groups = []
+        for rect in sorted(r for rects in self._regions.values() for r in rects):
+            for i, group in enumerate(groups):
+                union = rect_union(group, rect)
+                if union[2] * union[3] <= (group[2] * group[3] + rect[2] * rect[3]) * self.merge_slack:
+                    groups[i] = union
+                    break
+            else:
+                groups.append(rect)
+        return groups
+
+    def get_frame(self, max_age=None):
+        """Returns the current shared frame, grabbing a new one if it is stale."""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            frame = self._frame
+            if frame is None or time.monotonic() - frame.timestamp > max_age:
+                frame = self._capture()
+                self._frame = frame
+            return frame
+
+    def _capture(self):
+        """Grabs every group. Called with the lock held so only one thread grabs per tick."""
+        timestamp = time.monotonic()
+        start = time.perf_counter()
+        self.backend.next_frame()
+        regions = []
+        for rect in self._groups:
+            image = self.backend.grab(rect)
+            image.setflags(write=False) # Shared by all categories
+            regions.append((rect, image))
+            self.grab_count += 1
+        self.frame_count += 1
+        frame = CapturedFrame(timestamp, regions, (time.perf_counter() - start) * 1000.0)
+        if self.recorder is not None:
+            try:
+                self.recorder.write(frame)
+            except Exception as e:
+                print(f"Recording error, stopping: {e}")
+                self.recorder.close()
+                self.recorder = None
+        return frame
+
+    def start_recording(self, path):
+        """Starts appending every captured frame to a FrameRecorder at path."""
+        recorder = FrameRecorder(path)
+        with self._lock:
+            if self.recorder is not None:
+                self.recorder.close()
+            self.recorder = recorder
+
+    def stop_recording(self):
+        """Stops recording and returns the finished FrameRecorder, or None."""
+        with self._lock:
+            recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+        return recorder
+
+    def set_backend(self, backend):
+        with self._lock:
+            old_backend, self.backend = self.backend, backend
+            self._frame = None
+        old_backend.close()
+
+    def close(self):
+        self.stop_recording()
+        self.backend.close()
+
+# --- Anchor Resolver ---
+class AnchorResolver:
+    """Evaluates each unique anchor once per frame and fans the result out.
+
+    Subscribers that use the same anchor image with overlapping anchor rects form
+    one group. A group is matched once over the union of its rects, and each
+    subscriber reads the best score from the part of the result map that lies
+    inside its own rect, which is exactly what matching its rect alone would give.
+    Before scanning, the last matched offset is re-checked with a template-sized
+    match; the full scan only runs when that check fails.
+    """
+    def __init__(self, template_bank, threshold=0.8):
+        self.template_bank = template_bank
+        self.threshold = threshold
+        self._subscribers = {} # engine -> (anchor image, (x, y, w, h))
+        self._groups = []
+        self._results = {} # engine -> bool for the last evaluated frame
+        self._frame_timestamp = None
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.verified_hits = 0
+        self.full_scans = 0
+
+    def subscribe(self, engine, anchor_image, rect):
+        with self._lock:
+            self._subscribers[engine] = (anchor_image, rect)
+            self._rebuild_groups()
+
+    def unsubscribe(self, engine):
+        with self._lock:
+            if self._subscribers.pop(engine, None) is not None:
+                self._results.pop(engine, None)
+                self._rebuild_groups()
+
+    def _rebuild_groups(self):
+        """Groups subscribers by anchor image and overlapping rects. Called with the lock held."""
+        old_locations = {(g['image'], g['rect']): g['last_location'] for g in self._groups}
+        groups = []
+        for engine, (image, rect) in self._subscribers.items():
+            if rect[2] <= 0 or rect[3] <= 0:
+                self._results[engine] = False # Empty anchor rect is never found
+                continue
+            for group in groups:
+                g = group['rect']
+                overlaps = (rect[0] < g[0] + g[2] and g[0] < rect[0] + rect[2] and
+                            rect[1] < g[1] + g[3] and g[1] < rect[1] + rect[3])
+                if group['image'] == image and overlaps:
+                    group['rect'] = rect_union(g, rect)
+                    group['members'].append((engine, rect))
+                    break
+            else:
+                groups.append({'image': image, 'rect': rect, 'members': [(engine, rect)]})
+        for group in groups:
+            group['last_location'] = old_locations.get((group['image'], group['rect']))
+        self._groups = groups
+        self._frame_timestamp = None # Re-evaluate on the next frame
+
+    def anchor_location(self, engine):
+        """Screen position of the last anchor match in engine's group, or None."""
+        with self._lock:
+            for group in self._groups:
+                if any(member is engine for member, _ in group['members']):
+                    return group['last_location']
+        return None
+
+    def resolve(self, frame, engine):
+        """Returns whether engine's anchor is visible in frame.
+
+        The first caller for a new frame evaluates every group and pushes the result
+        to every subscriber through set_anchor_found().
+        """
+        with self._lock:
+            if self._frame_timestamp != frame.timestamp:
+                self._frame_timestamp = frame.timestamp
+                for group in self._groups:
+                    self._evaluate_group(frame, group)
+                results = dict(self._results)
+            else:
+                results = None
+            found = self._results.get(engine, False)
+
+        if results is not None:
+            for subscriber, subscriber_found in results.items():
+                subscriber.set_anchor_found(subscriber_found)
+        return found
+
+    def _evaluate_group(self, frame, group):
+        """Matches one anchor group against frame. Called with the lock held."""
+        self.evaluations += 1
+        members = group['members']
+        template = self.template_bank.get(group['image'])
+        if template is None:
+            print(f"Warning: Anchor template not found at images/{group['image']}")
+            for engine, _ in members:
+                self._results[engine] = False
+            return
+
+        screen_np = frame.view(group['rect'])
+        if screen_np is None or screen_np.size == 0:
+            return # Frame predates a region change; keep last results for one tick
+        gray = cv2.cvtColor(screen_np, cv2.COLOR_BGR2GRAY)
+        th, tw = template.shape[:2]
+        gx, gy = group['rect'][0], group['rect'][1]
+
+        # --- Cheap check at the last matched offset ---
+        location = group['last_location']
+        if location is not None:
+            lx, ly = location[0] - gx, location[1] - gy
+            if 0 <= lx and 0 <= ly and lx + tw <= gray.shape[1] and ly + th <= gray.shape[0]:
+                patch = gray[ly:ly + th, lx:lx + tw]
+                score = cv2.matchTemplate(patch, template, cv2.TM_CCOEFF_NORMED)[0, 0]
+                anchor_rect = (location[0], location[1], tw, th)
+                if score > self.threshold and all(rect_contains(rect, anchor_rect) for _, rect in members):
+                    self.verified_hits += 1
+                    for engine, _ in members:
+                        self._results[engine] = True
+                    return
+
+        # --- Full scan over the union rect ---
+        self.full_scans += 1
+        if th > gray.shape[0] or tw > gray.shape[1]:
+            print(f"Warning: Anchor template {group['image']} larger than anchor region.")
+            for engine, _ in members:
+                self._results[engine] = False
+            return
+        res = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        group['last_location'] = (gx + max_loc[0], gy + max_loc[1]) if max_val > self.threshold else None
+
+        for engine, rect in members:
+            # Top-left positions where the template fits completely inside this member's rect
+            x0, y0 = rect[0] - gx, rect[1] - gy
+            sub = res[y0:y0 + rect[3] - th + 1, x0:x0 + rect[2] - tw + 1]
+            if sub.size == 0:
+                print(f"Warning: Anchor template {group['image']} larger than anchor region.")
+                self._results[engine] = False
+            else:
+                self._results[engine] = float(sub.max()) > self.threshold
+
+# --- Frame Change Gate ---
+class FrameChangeGate:
+    """Finds which rows of a search view changed since the previous tick.
+
+    Compares a column-strided sample of the view (every column_step-th pixel column)
+    with the sample kept from the last call. Buff icons are far wider than the
+    stride, so an icon appearing or disappearing always shows up in the sample.
+    """
+    def __init__(self, column_step=2):
+        self.column_step = column_step
+        self._previous = None
+        self.frames = 0
+        self.skipped_frames = 0 # Nothing changed, matching skipped entirely
+        self.partial_frames = 0 # Only a band of rows was re-matched
+
+    def changed_rows(self, screen_np):
+        """Returns (start, stop) of the changed row band; (0, 0) means unchanged."""
+        self.frames += 1
+        sample = screen_np[:, ::self.column_step]
+        previous = self._previous
+        self._previous = sample.copy()
+        if previous is None or previous.shape != sample.shape:
+            return (0, screen_np.shape[0])
+
+        rows = np.flatnonzero((sample != previous).reshape(sample.shape[0], -1).any(axis=1))
+        if rows.size == 0:
+            self.skipped_frames += 1
+            return (0, 0)
+        if rows[0] > 0 or rows[-1] + 1 < screen_np.shape[0]:
+            self.partial_frames += 1
+        return (int(rows[0]), int(rows[-1]) + 1)
+
+    def reset(self):
+        self._previous = None
+
+# --- Batched Matcher ---
+class BatchedMatcher:
+    """Scores many templates against one frame with one vectorized pass per template shape.
+
+    Templates are grouped by shape and their zero-mean versions and norms are
+    precomputed once. Small templates (area up to DIRECT_MAX_AREA) are
+    correlated directly: the search windows are gathered into one matrix and
+    multiplied with every template of the shape at once. Larger ones are padded
+    to the frame's DFT size and transformed once, so per frame a single forward
+    FFT of the frame and one batched inverse FFT cover all of them. Window norms
+    come from box sums shared by all templates of a shape. The result is
+    TM_CCOEFF_NORMED including OpenCV's handling of flat windows, and the max
+    scores agree with cv2.matchTemplate within TOLERANCE.
+
+    This buys score parity, not speed: with the shipped templates (a dozen
+    shapes of about 10x10 px) the per-shape normalization costs about as much
+    as one matchTemplate per template, so match mode 'batched' runs at roughly
+    the speed of 'standard' (see benchmark.py batched). PyramidMatcher uses
+    it for its coarse pass, where the shrunk templates are small enough for
+    the direct path to pay off.
+    """
+    TOLERANCE = 1e-4 # Observed error is below 1e-4 on the shipped templates
+    DIRECT_MAX_AREA = 0 # Full-size templates are cheaper through the FFT on a 25 px wide strip
+    MAX_PREPARED = 8 # Template sets kept prepared, e.g. one per combination of due poll tiers
+
+    def __init__(self):
+        self._templates = () # (name, template) pairs the groups were built from
+        self._groups = []
+        self._transformed = [] # zero-mean float32 templates of the FFT groups, in group order
+        self._spectra = {} # DFT size -> (n, P, Q//2 + 1) conjugated template spectra
+        self._prepared = {} # names -> parked (templates, groups, transformed, spectra), oldest first
+
+    @staticmethod
+    def _same_templates(a, b):
+        return len(a) == len(b) and all(x[0] == y[0] and x[1] is y[1] for x, y in zip(a, b))
+
+    def prepare(self, templates):
+        """(Re)builds the per-shape groups if the template list changed.
+
+        The previous set is parked, so alternating between a few sets (such as the
+        debuffs due on fast and slow ticks) doesn't rebuild anything.
+        """
+        templates = tuple(templates)
+        if self._same_templates(templates, self._templates):
+            return
+        if self._templates:
+            self._prepared[tuple(name for name, _ in self._templates)] = (
+                self._templates, self._groups, self._transformed, self._spectra)
+        parked = self._prepared.pop(tuple(name for name, _ in templates), None)
+        if parked is not None and self._same_templates(templates, parked[0]):
+            self._templates, self._groups, self._transformed, self._spectra = parked
+            return
+        while len(self._prepared) >= self.MAX_PREPARED:
+            self._prepared.pop(next(iter(self._prepared)))
+
+        by_shape = {}
+        for name, template in templates:
+            by_shape.setdefault(template.shape[:2], []).append((name, template))
+        groups, transformed = [], []
+        for shape, items in by_shape.items():
+            flat = np.stack([t.reshape(-1).astype(np.float64) for _, t in items])
+            centered = flat - flat.mean(axis=1, keepdims=True)
+            norms = np.sqrt((centered ** 2).sum(axis=1))
+            group = {
+                'shape': shape,
+                'names': [name for name, _ in items],
+                'norms': norms.astype(np.float32)[:, None, None],
+                'flat': norms < np.finfo(np.float64).eps, # Flat templates score 1
+            }
+            if shape[0] * shape[1] <= self.DIRECT_MAX_AREA:
+                group['kernels'] = np.ascontiguousarray(centered.T.astype(np.float32)) # (h*w, n)
+            else:
+                group['slice'] = slice(len(transformed), len(transformed) + len(items)) # rows of the spectra
+                transformed.extend(c.reshape(shape).astype(np.float32) for c in centered)
+            groups.append(group)
+        self._templates = templates
+        self._groups = groups
+        self._transformed = transformed
+        self._spectra = {}
+
+    def _template_spectra(self, size):
+        spectra = self._spectra.get(size)
+        if spectra is None:
+            padded = np.zeros((len(self._transformed),) + size, np.float32)
+            for i, centered in enumerate(self._transformed):
+                if centered.shape[0] <= size[0] and centered.shape[1] <= size[1]:
+                    padded[i, :centered.shape[0], :centered.shape[1]] = centered
+            spectra = np.conj(np.fft.rfft2(padded))
+            self._spectra[size] = spectra
+        return spectra
+
+    def match(self, gray, templates):
+        """Returns {name: max TM_CCOEFF_NORMED score} for every template that fits in gray."""
+        scores = {}
+        for group, result in self._group_results(gray, templates):
+            scores.update(zip(group['names'], result.reshape(len(result), -1).max(axis=1).tolist()))
+        return scores
+
+    def score_maps(self, gray, templates):
+        """Returns {name: TM_CCOEFF_NORMED result map} for every template that fits in gray."""
+        maps = {}
+        for group, result in self._group_results(gray, templates):
+            maps.update(zip(group['names'], result))
+        return maps
+
+    def _group_results(self, gray, templates):
+        """Yields (group, result) with one (rows, cols) result map per template of the group."""
+        self.prepare(templates)
+        correlation = None
+        if self._transformed:
+            # Circular correlation is exact at valid positions as long as the DFT covers the frame
+            size = (cv2.getOptimalDFTSize(gray.shape[0]), cv2.getOptimalDFTSize(gray.shape[1]))
+            frame_spectrum = np.fft.rfft2(gray.astype(np.float32), s=size)
+            correlation = np.fft.irfft2(self._template_spectra(size) * frame_spectrum, s=size)
+
+        for group in self._groups:
+            th, tw = group['shape']
+            if th > gray.shape[0] or tw > gray.shape[1]:
+                continue
+            rows, cols = gray.shape[0] - th + 1, gray.shape[1] - tw + 1
+            # Window correlation with the zero-mean templates; the window mean drops out
+            if 'kernels' in group:
+                windows = sliding_window_view(gray, (th, tw)).reshape(rows * cols, th * tw)
+                numerators = (windows.astype(np.float32) @ group['kernels']).T.reshape(-1, rows, cols)
+            else:
+                numerators = correlation[group['slice'], :rows, :cols]
+
+            # Window norms in float64, the sum-of-squares difference cancels badly in float32.
+            # Box sums of uint8 pixels are exact integers, anchored at the window's top-left.
+            sums = cv2.boxFilter(gray, cv2.CV_64F, (tw, th), anchor=(0, 0), normalize=False,
+                                 borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+            sums_sq = cv2.sqrBoxFilter(gray, cv2.CV_64F, (tw, th), anchor=(0, 0), normalize=False,
+                                       borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+            window_norms = np.sqrt(np.maximum(sums_sq - sums * sums / (th * tw), 0)).astype(np.float32)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = numerators / (window_norms * group['norms'])
+            # Same rules as OpenCV: values just past +-1 clamp to +-1, flat windows (and
+            # anything further out) score 0
+            result = np.clip(ratio, -1.0, 1.0)
+            result[~(np.abs(ratio) < 1.125)] = 0.0
+            result[group['flat']] = 1.0
+            yield group, result
+
+# --- Slot Classifier ---
+class SlotClassifier:
+    """Classifies the fixed grid of buff slots instead of sliding templates over the whole column.
+
+    The column is split into cells of slot_pitch rows starting at slot_offset. With
+    pitch 0 the grid is found automatically: the pitch from the autocorrelation of
+    the column's row profile and the phase from the anchor's matched row.
+
+    Detection templates are crops of the buff icons, so each template's position
+    inside its slot is learned from one full scan the first time it is seen. After
+    that each cell is only compared at that position (+- jitter pixels): the
+    zero-mean, unit-norm patches of all cells are scored against the template in
+    one vectorized pass, and every cell is assigned to its nearest template.
+    Templates that are not present are re-scanned every recalibrate_ticks ticks in
+    case the icon layout shifted.
+    """
+    def __init__(self, pitch=0, offset=0, jitter=2, threshold=0.8, recalibrate_ticks=20,
+                 min_pitch=12, max_pitch=64):
+        self.pitch = pitch
+        self.offset = offset
+        self.jitter = jitter
+        self.threshold = threshold
+        self.recalibrate_ticks = recalibrate_ticks
+        self.min_pitch = min_pitch
+        self.max_pitch = max_pitch
+        self.template_offsets = {} # name -> (template, pitch, (row, col) inside the slot)
+        self._auto_pitch = None
+        self._auto_pitch_shape = None
+        self._ticks = 0
+        self._present = set()
+        self.calibration_scans = 0
+        self.slot_passes = 0
+
+    def estimate_pitch(self, gray):
+        """Finds the slot pitch from the periodicity of the column's row edges, or None.
+
+        Icon borders give a row-edge profile that repeats every slot. The profile is
+        detrended and each candidate lag is scored by the mean autocorrelation at 1x,
+        2x and 3x the lag, so half-pitch aliases score lower than the real pitch.
+        """
+        if self._auto_pitch_shape == gray.shape and self._auto_pitch is not None:
+            return self._auto_pitch
+        profile = np.abs(np.diff(gray.astype(np.float64), axis=0)).mean(axis=1)
+        trend = cv2.blur(profile.reshape(-1, 1), (1, self.max_pitch + 1)).ravel()
+        profile = profile - trend
+        energy = float(profile @ profile)
+        if energy <= 0 or len(profile) <= 2 * self.min_pitch:
+            return None
+
+        def autocorrelation(lag):
+            return float(profile[:-lag] @ profile[lag:]) / energy if lag < len(profile) else 0.0
+
+        lags = np.arange(self.min_pitch, min(self.max_pitch, len(profile) // 2) + 1)
+        comb = np.array([np.mean([autocorrelation(lag * m) for m in (1, 2, 3)]) for lag in lags])
+        best = int(np.argmax(comb))
+        if comb[best] < 0.2:
+            return None # No clear repeating slot structure (e.g. one or two buffs up)
+        self._auto_pitch = int(lags[best])
+        self._auto_pitch_shape = gray.shape
+        return self._auto_pitch
+
+    def grid(self, gray, anchor_row=None):
+        """Returns (pitch, offset) of the slot grid in gray, or None if it can't be determined."""
+        if self.pitch > 0:
+            return self.pitch, self.offset
+        pitch = self.estimate_pitch(gray)
+        if pitch is None:
+            return None
+        if anchor_row is None or anchor_row % pitch == 0:
+            return pitch, 0
+        return pitch, anchor_row % pitch - pitch # First cell may start above the column so it is fully covered
+
+    def classify(self, gray, templates, anchor_row=None):
+        """Returns (scores, slots).
+
+        scores maps every template name to its best score among the cells it won
+        (0.0 if it won none); slots maps each present name to its slot indices.
+        Returns None if no slot grid could be found.
+        """
+        grid = self.grid(gray, anchor_row)
+        if grid is None:
+            return None
+        pitch, offset = grid
+        self._ticks += 1
+        recalibrate = self._ticks % self.recalibrate_ticks == 0
+        cell_count = max((gray.shape[0] - offset + pitch - 1) // pitch, 0)
+        cell_tops = offset + np.arange(cell_count) * pitch
+        shifts = np.arange(-self.jitter, self.jitter + 1)
+
+        names, cell_scores, scores, slots = [], [], {}, {}
+        for name, template in templates:
+            th, tw = template.shape[:2]
+            if th > gray.shape[0] or tw > gray.shape[1]:
+                continue
+            learned = self.template_offsets.get(name)
+            if learned is None or learned[0] is not template or learned[1] != pitch or (
+                    recalibrate and name not in self._present):
+                # --- Calibration: full scan to learn where the template sits inside its slot ---
+                self.calibration_scans += 1
+                res = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+                _, max_val, _, max_loc = cv2.minMaxLoc(res)
+                if max_val >= self.threshold:
+                    in_slot = ((max_loc[1] - offset) % pitch, max_loc[0])
+                    self.template_offsets[name] = (template, pitch, in_slot)
+                    scores[name] = max_val
+                    slots[name] = [(max_loc[1] - offset) // pitch]
+                else:
+                    scores[name] = max_val
+                continue
+
+            # --- Slot pass: only the learned position in every cell, +- jitter ---
+            row, col = learned[2]
+            ys = (cell_tops + row)[:, None, None] + shifts[None, :, None]
+            xs = np.broadcast_to(col + shifts[None, None, :], ys.shape[:2] + (len(shifts),))
+            ys = np.broadcast_to(ys, xs.shape)
+            valid = (ys >= 0) & (ys + th <= gray.shape[0]) & (xs >= 0) & (xs + tw <= gray.shape[1])
+            windows = sliding_window_view(gray, (th, tw))
+            patches = windows[np.clip(ys, 0, windows.shape[0] - 1), np.clip(xs, 0, windows.shape[1] - 1)]
+            patches = patches.reshape(patches.shape[:3] + (th * tw,)).astype(np.float32)
+            patches -= patches.mean(axis=-1, keepdims=True)
+            kernel = template.reshape(-1).astype(np.float32)
+            kernel -= kernel.mean()
+            denominators = np.linalg.norm(patches, axis=-1) * np.linalg.norm(kernel)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ncc = np.where(denominators > 1e-6, (patches @ kernel) / denominators, 0.0)
+            ncc[~valid] = -1.0
+            names.append(name)
+            cell_scores.append(ncc.reshape(cell_count, -1).max(axis=1))
+            self.slot_passes += 1
+
+        if names:
+            # --- Nearest neighbour: every cell belongs to its best-scoring template ---
+            matrix = np.stack(cell_scores) # (templates, cells)
+            winners = np.argmax(matrix, axis=0)
+            for i, name in enumerate(names):
+                won = winners == i
+                scores[name] = float(matrix[i][won].max()) if won.any() else 0.0
+                present = np.flatnonzero(won & (matrix[i] >= self.threshold))
+                if present.size:
+                    slots[name] = present.tolist()
+        # Templates not passed in this call keep their presence
+        passed = {name for name, _ in templates}
+        self._present = {name for name in self._present if name not in passed} | {
+            name for name, indices in slots.items() if scores.get(name, 0.0) >= self.threshold}
+        return scores, {name: indices for name, indices in slots.items() if name in self._present}
+
+# --- Pyramid Matcher ---
+class PyramidMatcher:
+    """Coarse-to-fine template matching.
+
+    The frame is shrunk by 2**levels with box averaging and every template is
+    matched against it in one BatchedMatcher pass. The best `candidates`
+    locations (with non-maximum suppression) are mapped back to full resolution
+    and only a small window around each is re-matched there, so the score
+    compared against the 0.8 threshold is always a full-resolution score.
+
+    Our templates are only 8-12 px, so a match that doesn't start on the coarse
+    pixel grid looks very different after shrinking. Each template is therefore
+    kept in one coarse variant per sampling phase (cropped so its top-left sits on
+    the grid); one of them always lines up with the frame's pixel blocks. The
+    variants are built once and cached. A template is never shrunk below
+    min_template_side pixels; one that can't be shrunk is matched exhaustively.
+    """
+    def __init__(self, levels=1, candidates=3, min_template_side=4):
+        self.levels = max(0, int(levels))
+        self.candidates = max(1, int(candidates))
+        self.min_template_side = min_template_side
+        self._variants = {} # name -> (template, scale, [((dy, dx), coarse template), ...])
+        self._coarse_matcher = BatchedMatcher()
+        self._coarse_matcher.DIRECT_MAX_AREA = 64 # Coarse templates are a few pixels, a matrix product beats the FFT
+        self.coarse_passes = 0
+        self.exhaustive_passes = 0
+
+    @staticmethod
+    def shrink(image, scale):
+        """Box-averages scale x scale blocks, dropping rows/columns that don't fill a block."""
+        h, w = image.shape[0] // scale, image.shape[1] // scale
+        return cv2.resize(image[:h * scale, :w * scale], (w, h), interpolation=cv2.INTER_AREA)
+
+    def template_variants(self, name, template):
+        """Returns (scale, [((dy, dx), coarse template), ...]); scale 1 means no usable level."""
+        cached = self._variants.get(name)
+        if cached is not None and cached[0] is template:
+            return cached[1], cached[2]
+        th, tw = template.shape[:2]
+        scale, variants = 1, []
+        for level in range(self.levels, 0, -1):
+            step = 2 ** level
+            # Crop size that fits every phase and is a whole number of blocks
+            ch, cw = (th - step + 1) // step * step, (tw - step + 1) // step * step
+            if min(ch, cw) // step < self.min_template_side:
+                continue
+            scale = step
+            variants = [((dy, dx), self.shrink(template[dy:dy + ch, dx:dx + cw], step))
+                        for dy in range(step) for dx in range(step)]
+            break
+        self._variants[name] = (template, scale, variants)
+        return scale, variants
+
+    def match(self, gray, templates):
+        """Returns {name: best full-resolution TM_CCOEFF_NORMED score}."""
+        scores = {}
+        coarse_templates = {} # scale -> [((name, dy, dx), coarse template), ...]
+        for name, template in templates:
+            th, tw = template.shape[:2]
+            if th > gray.shape[0] or tw > gray.shape[1]:
+                continue
+            scale, variants = self.template_variants(name, template)
+            if scale == 1 or variants[0][1].shape[0] > gray.shape[0] // scale or \
+                    variants[0][1].shape[1] > gray.shape[1] // scale:
+                self.exhaustive_passes += 1
+                scores[name] = float(cv2.minMaxLoc(cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED))[1])
+                continue
+            coarse_templates.setdefault(scale, []).extend(((name, dy, dx), small) for (dy, dx), small in variants)
+
+        lookup = dict(templates)
+        for scale, entries in coarse_templates.items():
+            # --- Coarse pass: every phase variant of every template in one batched pass ---
+            self.coarse_passes += 1
+            maps = self._coarse_matcher.score_maps(self.shrink(gray, scale), entries)
+            by_name = {}
+            for (name, dy, dx), result in maps.items():
+                by_name.setdefault(name, []).append(((dy, dx), result))
+
+            for name, phase_maps in by_name.items():
+                template = lookup[name]
+                th, tw = template.shape[:2]
+                stacked = np.stack([result for _, result in phase_maps])
+                ch, cw = phase_maps[0][1].shape
+                suppress_y, suppress_x = max(th // (2 * scale), 1), max(tw // (2 * scale), 1)
+                best = -1.0
+                for _ in range(self.candidates):
+                    phase, cy, cx = np.unravel_index(int(np.argmax(stacked)), stacked.shape)
+                    if stacked[phase, cy, cx] <= -1.0:
+                        break
+                    stacked[:, max(cy - suppress_y, 0):cy + suppress_y + 1, max(cx - suppress_x, 0):cx + suppress_x + 1] = -1.0
+
+                    # --- Full-resolution verification around the candidate ---
+                    dy, dx = phase_maps[phase][0]
+                    x, y = cx * scale - dx, cy * scale - dy # Top-left of the uncropped template
+                    x0, y0 = max(x - 1, 0), max(y - 1, 0)
+                    window = gray[y0:min(y + th + 1, gray.shape[0]), x0:min(x + tw + 1, gray.shape[1])]
+                    if window.shape[0] >= th and window.shape[1] >= tw:
+                        fine = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+                        best = max(best, float(cv2.minMaxLoc(fine)[1]))
+                        if best >= 0.999:
+                            break # Can't do better than an exact match
+                scores[name] = best
+        return scores
+
+# --- Metrics ---
+class RollingHistogram:
+    """Latency histogram over the last `window` seconds, cheap enough to update every tick.
+
+    Values land in fixed log-spaced buckets (12% apart, 10 us to 100 s), so a
+    record is one bisect and an increment. Two generations are kept and the
+    older one is dropped every half window, so a summary covers between half a
+    window and a whole one. Percentiles are bucket upper bounds.
+    """
+    BOUNDS = [0.01 * 1.12 ** i for i in range(143)] # milliseconds
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._generations = [self._empty(), self._empty()] # [older, current]
+        self._rotated = time.monotonic()
+
+    def _empty(self):
+        return {'counts': [0] * (len(self.BOUNDS) + 1), 'count': 0, 'sum': 0.0, 'max': 0.0}
+
+    def record(self, value_ms):
+        index = bisect.bisect_left(self.BOUNDS, value_ms)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._rotated >= self.window / 2:
+                self._generations = [self._generations[1], self._empty()]
+                self._rotated = now
+            current = self._generations[1]
+            current['counts'][index] += 1
+            current['count'] += 1
+            current['sum'] += value_ms
+            current['max'] = max(current['max'], value_ms)
+
+    def summary(self):
+        with self._lock:
+            older, current = self._generations
+            counts = [a + b for a, b in zip(older['counts'], current['counts'])]
+            count = older['count'] + current['count']
+            total = older['sum'] + current['sum']
+            peak = max(older['max'], current['max'])
+        result = {'count': count, 'mean': round(total / count, 3) if count else 0.0}
+        for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            target, seen, value = fraction * count, 0, 0.0
+            for index, bucket in enumerate(counts):
+                seen += bucket
+                if count and seen >= target:
+                    value = min(self.BOUNDS[index] if index < len(self.BOUNDS) else peak, peak)
+                    break
+            result[name] = round(value, 3)
+        result['max'] = round(peak, 3)
+        return result
+
+class CategoryMetrics:
+    """Rolling latency histograms and counters for one category.
+
+    Filled in by its DetectionEngine (grab, match and tick times, and the CPU
+    time of the tick on the scheduler thread), the scheduler
+    (missed deadlines, tick errors), the worker pool in process mode and the
+    window (signal-to-paint delay). Read through snapshot().
+    """
+    HISTOGRAMS = ('grab_ms', 'match_ms_per_debuff', 'tick_ms', 'tick_cpu_ms', 'paint_delay_ms')
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self.histograms = {name: RollingHistogram(window) for name in self.HISTOGRAMS}
+        self.counters = {'ticks': 0, 'missed_deadlines': 0, 'errors': 0}
+        self._tick_times = deque() # monotonic start of each tick in the window
+
+    def record(self, name, value_ms):
+        self.histograms[name].record(value_ms)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def tick(self):
+        now = time.monotonic()
+        self.counters['ticks'] += 1
+        self._tick_times.append(now)
+        while self._tick_times and now - self._tick_times[0] > self.window:
+            self._tick_times.popleft()
+
+    def snapshot(self):
+        times = list(self._tick_times)
+        span = max(time.monotonic() - times[0], 1e-6) if times else 0.0
+        snapshot = {'ticks_per_s': round(len(times) / span, 2) if span else 0.0, **self.counters}
+        for name, histogram in self.histograms.items():
+            snapshot[name] = histogram.summary()
+        return snapshot
+
+class LatencyTracer:
+    """Follows detection changes from the screen grab to the overlay repaint.
+
+    The engine starts a trace dict for each change with its frame's grab start
+    and end and the moment the change was emitted (all time.monotonic()). The
+    window adds when it handled the change and when the icon, or the window
+    for a removed icon, was next painted. finish() turns those hand-offs into
+    stage latencies:
+
+        grab    grab start -> grab done
+        detect  grab done -> change emitted (scheduler wait, anchor, matching)
+        queue   emitted -> handled on the GUI thread (Qt event queue)
+        update  handling: widget and layout changes
+        paint   handled -> painted
+        total   grab start -> painted
+
+    With trace_file set, every change is also appended as Chrome trace events,
+    one track per category, which chrome://tracing and ui.perfetto.dev load.
+    """
+    STAGES = (('grab', 'frame', 'grabbed'), ('detect', 'grabbed', 'emitted'), ('queue', 'emitted', 'handled'),
+              ('update', 'handled', 'updated'), ('paint', 'updated', 'painted'), ('total', 'frame', 'painted'))
+
+    def __init__(self, trace_file=''):
+        self.histograms = {stage: RollingHistogram() for stage, _, _ in self.STAGES}
+        self.traced = 0
+        self._tracks = {} # category name -> trace file tid
+        self._file = None
+        self._lock = threading.Lock()
+        if trace_file:
+            try:
+                self._file = open(trace_file, 'w')
+                self._file.write('[\n') # Viewers accept the array without its closing bracket
+                print(f"Writing latency trace to {trace_file}")
+            except OSError as e:
+                print(f"Could not open trace file {trace_file}: {e}")
+
+    def finish(self, trace):
+        """Records a completed (or, if never painted, partial) trace."""
+        for stage, start, end in self.STAGES:
+            if start in trace and end in trace:
+                self.histograms[stage].record((trace[end] - trace[start]) * 1000.0)
+        with self._lock:
+            self.traced += 1
+            if self._file is not None:
+                self._write(trace)
+
+    def _write(self, trace):
+        """Appends one change as complete ('X') events. Called with the lock held."""
+        tid = self._tracks.get(trace['category'])
+        if tid is None:
+            tid = self._tracks[trace['category']] = len(self._tracks) + 1
+            self._file.write(json.dumps({'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': tid,
+                                         'args': {'name': trace['category']}}) + ',\n')
+        args = {'debuff': trace['debuff'], 'detected': trace['detected']}
+        for stage, start, end in self.STAGES:
+            if stage == 'total' or start not in trace or end not in trace:
+                continue
+            self._file.write(json.dumps({
+                'ph': 'X', 'name': stage, 'cat': 'detection', 'pid': 1, 'tid': tid,
+                'ts': round(trace[start] * 1e6, 1), 'dur': round((trace[end] - trace[start]) * 1e6, 1), 'args': args,
+            }) + ',\n')
+        self._file.flush()
+
+    def summary(self):
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def format_metrics(snapshot):
+    """Plain-text rendering of DebuffTracker.performance_snapshot() for the tray and the endpoint."""
+    capture = snapshot['capture']
+    lines = [f"Capture ({capture['backend']}): {capture['grabs']} grabs, avg {capture['avg_ms']} ms, max {capture['max_ms']} ms"]
+    if 'cpu' in snapshot:
+        lines.append(format_cpu(snapshot['cpu']))
+    for name, metrics in snapshot['categories'].items():
+        lines.append("")
+        lines.append(f"{name}: {metrics['ticks_per_s']} ticks/s, {metrics['ticks']} ticks, "
+                     f"{metrics['missed_deadlines']} missed deadlines, {metrics['errors']} errors")
+        for key in CategoryMetrics.HISTOGRAMS:
+            h = metrics[key]
+            lines.append(f"  {key}: n={h['count']} mean {h['mean']} p50 {h['p50']} p95 {h['p95']} "
+                         f"p99 {h['p99']} max {h['max']}")
+    if 'latency' in snapshot:
+        lines.append("")
+        lines.append("Grab to paint (ms), all categories:")
+        for stage, h in snapshot['latency'].items():
+            lines.append(f"  {stage}: n={h['count']} mean {h['mean']} p50 {h['p50']} p95 {h['p95']} "
+                         f"p99 {h['p99']} max {h['max']}")
+    return "\n".join(lines)
+
+def format_cpu(cpu):
+    """One line of CpuGovernor.stats() for the stats dialogs."""
+    line = f"Detection CPU: {cpu['usage_percent']}% of a core"
+    if not cpu['cap_percent']:
+        return line + " (no cap)"
+    line += f", cap {cpu['cap_percent']}%"
+    if cpu['throttled']:
+        return line + f", throttled to {cpu['rate_scale'] * 100:.0f}% of configured rates"
+    return line + ", full rate"
+
+class MetricsServer:
+    """Serves a metrics snapshot on 127.0.0.1: /metrics as text, /metrics.json as JSON.
+
+    snapshot is a callable returning a DebuffTracker.performance_snapshot() dict;
+    it is called on the server's thread.
+    """
+    def __init__(self, port, snapshot):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path not in ('/', '/metrics', '/metrics.json'):
+                    self.send_error(404)
+                    return
+                data = snapshot()
+                if path == '/metrics.json':
+                    body, content_type = json.dumps(data, indent=2).encode(), 'application/json'
+                else:
+                    body, content_type = format_metrics(data).encode(), 'text/plain; charset=utf-8'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Polling it shouldn't spam the console
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', int(port)), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# --- Sampling Profiler ---
+class SamplingProfiler:
+    """Samples the stacks of every thread in this process for a bounded time.
+
+    A daemon thread reads sys._current_frames() every interval and counts each
+    distinct stack, so the cost while running is one stack walk per thread per
+    sample and nothing is hooked into the threads being profiled. Nothing runs
+    while stopped. Results go to a collapsed-stack file ("thread;outer;...;inner
+    count" per line), which flamegraph.pl, speedscope and similar tools read.
+    Worker processes in process mode are not sampled.
+    """
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self.path = None
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, path, duration=30.0, interval=0.005):
+        """Starts sampling into path; stops by itself after duration seconds."""
+        if self.running:
+            return
+        self.path = Path(path)
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration, interval), name="SamplingProfiler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and waits for the file to be written."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+
+    @staticmethod
+    def frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+    def _run(self, duration, interval):
+        stacks = {}
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self.frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"Thread-{ident}"))
+                stack = ';'.join(reversed(labels))
+                stacks[stack] = stacks.get(stack, 0) + 1
+            self.samples += 1
+            self._stop.wait(interval)
+        try:
+            with open(self.path, 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            print(f"Profile written to {self.path} ({self.samples} samples)")
+        except OSError as e:
+            print(f"Error writing profile to {self.path}: {e}")
+
+# --- Match Thread Pools ---
+_match_executors = {} # thread count -> [ThreadPoolExecutor, users], shared by every category using that count
+_match_executors_lock = threading.Lock()
+_cv2_threads = None # cv2.getNumThreads() from before the first pool, restored when the last one closes
+
+def _resize_cv2_threads():
+    """Shrinks OpenCV's pool for the widest match pool, or restores it when none is left."""
+    global _cv2_threads
+    if _match_executors:
+        if _cv2_threads is None:
+            _cv2_threads = cv2.getNumThreads()
+        cv2.setNumThreads(max(1, (os.cpu_count() or 1) // max(_match_executors)))
+    elif _cv2_threads is not None:
+        cv2.setNumThreads(_cv2_threads)
+        _cv2_threads = None
+
+def match_executor(threads):
+    """Returns the shared pool for matching with `threads` threads, or None for sequential matching.
+
+    cv2.matchTemplate releases the GIL, so one category's templates can run in
+    parallel. OpenCV's own thread pool is shrunk to cores // threads (for the widest
+    pool in use) so the two don't oversubscribe the cores. Every call must be paired
+    with release_match_executor(threads).
+    """
+    threads = int(threads or 1)
+    if threads <= 1:
+        return None
+    with _match_executors_lock:
+        entry = _match_executors.get(threads)
+        if entry is None:
+            entry = [ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"Match{threads}"), 0]
+            _match_executors[threads] = entry
+            _resize_cv2_threads()
+        entry[1] += 1
+        return entry[0]
+
+def release_match_executor(threads):
+    """Drops one user of the `threads` pool; the last user shuts it down."""
+    threads = int(threads or 1)
+    if threads <= 1:
+        return
+    with _match_executors_lock:
+        entry = _match_executors.get(threads)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _match_executors[threads]
+            entry[0].shutdown(wait=False) # Its last user is between ticks, nothing is queued
+            _resize_cv2_threads()
+
+# --- Category Matcher ---
+def diff_detection_states(last_state, states, skip=()):
+    """Applies one tick's {name: detected} to last_state and returns the changes.
+
+    A name changes when its new state differs from the last one. Names that were
+    detected but got no state this tick (template missing or too large) turn
+    False, unless they are in skip because they weren't due.
+    """
+    changes = []
+    for name, detected in states.items():
+        if last_state.get(name) != detected:
+            last_state[name] = detected
+            changes.append((name, detected))
+    for name, detected in list(last_state.items()):
+        if detected and name not in states and name not in skip:
+            last_state[name] = False
+            changes.append((name, False))
+    return changes
+
+class DetectionDiff(namedtuple('DetectionDiff', 'category seq frame_timestamp changes scores traces')):
+    """One tick's detection changes for a category, published to DetectionEngine subscribers.
+
+    changes holds (debuff name, detected) in the order they were found, scores
+    the changed debuffs' match scores (None when unknown) and traces a
+    LatencyTracer dict (or None) per change. A diff is never modified once
+    published; seq counts up per category, so diffs queued behind each other
+    can be merged with the newest state winning.
+    """
+    __slots__ = ()
+
+    @property
+    def appeared(self):
+        return tuple(name for name, detected in self.changes if detected)
+
+    @property
+    def disappeared(self):
+        return tuple(name for name, detected in self.changes if not detected)
+
+class CategoryMatcher:
+    """Template matching for one category, independent of its window.
+
+    Holds the frame-change gate, the per-debuff score caches and the batched, slot
+    and pyramid matchers, and turns a search view into detection states. In
+    thread mode each DetectionEngine owns one; in process mode each category's
+    lives in a detection worker process.
+    """
+    def __init__(self, category_config, debuffs, threshold=0.8, match_threads=None):
+        self.category_name = category_config['name']
+        self.debuffs = debuffs
+        self.threshold = category_config.get('threshold', threshold)
+        if match_threads is None:
+            match_threads = category_config.get('match_threads', 1)
+        self.match_threads = max(1, int(match_threads or 1))
+        self.executor = match_executor(self.match_threads) # None = match one template after another
+        self._counter_lock = threading.Lock() # match_debuff runs on pool threads
+        self.pool_cpu_s = 0.0 # CPU time spent on match threads since take_pool_cpu()
+        self.change_gate = FrameChangeGate()
+        self.match_cache = {} # debuff name -> (template, result map, max score)
+        self.pending_bands = {} # debuff name -> rows changed since it was last matched
+        self.match_mode = category_config.get('match_mode', 'standard').lower()
+        self.batched_matcher = BatchedMatcher()
+        self.present_slots = {} # debuff name -> slot indices, slot mode only
+        self.batch_cache = {} # debuff name -> (template, score) from the batched, slot or pyramid matcher
+        self.mode_params = None # Config the slot classifier and pyramid matcher were built from
+        self.build_mode_matchers(category_config)
+        self.last_scores = {} # debuff name -> score of its last match, whichever matcher produced it
+        self.skipped_matches = 0
+        self.partial_matches = 0
+        self.full_matches = 0
+        self.errors = 0 # Failed matches, each also printed
+
+    def build_mode_matchers(self, category_config):
+        """(Re)builds the slot classifier and pyramid matcher if their settings changed."""
+        params = (category_config.get('slot_pitch', 0), category_config.get('slot_offset', 0),
+                  category_config.get('slot_jitter', 2), category_config.get('pyramid_levels', 1),
+                  category_config.get('pyramid_candidates', 3))
+        if params == self.mode_params:
+            return
+        self.mode_params = params
+        pitch, offset, jitter, levels, candidates = params
+        self.slot_classifier = SlotClassifier(pitch=pitch, offset=offset, jitter=jitter) # pitch 0 = find the grid automatically
+        self.pyramid_matcher = PyramidMatcher(levels=levels, candidates=candidates)
+        self.present_slots.clear()
+        self.batch_cache.clear() # Scores from the old classifier or pyramid
+
+    def reconfigure(self, category_config, debuffs, threshold=None, match_threads=None):
+        """Applies a new debuff selection, match mode, threshold or thread count in place.
+
+        Called between two ticks. Cached results of debuffs that stay selected are
+        kept; scores from a match mode that is no longer used are dropped.
+        """
+        self.category_name = category_config['name']
+        names = {d['name'] for d in debuffs}
+        for cache in (self.match_cache, self.pending_bands, self.batch_cache, self.last_scores, self.present_slots):
+            for name in [name for name in cache if name not in names]:
+                del cache[name]
+        self.debuffs = debuffs
+        self.threshold = category_config.get('threshold', self.threshold if threshold is None else threshold)
+        match_mode = category_config.get('match_mode', 'standard').lower()
+        if match_mode != self.match_mode:
+            self.match_mode = match_mode
+            self.batch_cache.clear()
+            self.present_slots.clear()
+        self.build_mode_matchers(category_config)
+        if match_threads is not None and max(1, int(match_threads or 1)) != self.match_threads:
+            release_match_executor(self.match_threads)
+            self.match_threads = max(1, int(match_threads or 1))
+            self.executor = match_executor(self.match_threads)
+
+    def close(self):
+        """Releases the match thread pool. The matcher isn't used afterwards."""
+        if self.executor is not None:
+            self.executor = None
+            release_match_executor(self.match_threads)
+
+    def reset(self):
+        """Forgets the previous frame, so the next detect() treats every row as changed."""
+        self.change_gate.reset()
+
+    def detect(self, screen_np, due, anchor_row=None):
+        """Returns {name: detected} for the due, enabled debuffs whose template fits screen_np."""
+        # Rows that changed since last tick; unchanged rows reuse cached scores
+        changed_band = self.change_gate.changed_rows(screen_np)
+        self.accumulate_changes(changed_band)
+        gray_screen = None # Converted lazily, only if something has to be matched
+
+        # --- Batched and slot modes score every template in one pass ---
+        batch_scores = None
+        if self.match_mode in ('batched', 'slots', 'pyramid'):
+            try:
+                batch_scores = self.match_selection(screen_np, due, anchor_row)
+            except Exception as batch_error:
+                self.errors += 1
+                print(f"{self.match_mode.capitalize()} matching error [{self.category_name}]: {batch_error}, using standard matcher.")
+        if batch_scores is None and self.executor is not None:
+            batch_scores = self.match_parallel(screen_np, due)
+
+        states = {}
+        for debuff in self.debuffs:
+            debuff_name = debuff['name']
+            if not debuff.get('enabled', True) or debuff_name not in due:
+                continue
+            try:
+                template = template_bank.get(debuff['detect_image'])
+                if template is None:
+                    continue # Skip if template missing
+
+                # Check if template is smaller than screen region
+                if template.shape[0] > screen_np.shape[0] or template.shape[1] > screen_np.shape[1]:
+                    continue # Skip if template too large
+
+                if batch_scores is not None:
+                    max_val = batch_scores.get(debuff_name)
+                    if max_val is None:
+                        continue
+                    if isinstance(max_val, Exception):
+                        raise max_val # From a pool thread, handled like a sequential match error
+                else:
+                    band = self.pending_bands.get(debuff_name, (0, screen_np.shape[0]))
+                    if gray_screen is None and not self.can_reuse_match(debuff_name, template, screen_np, band):
+                        gray_screen = cv2.cvtColor(screen_np, cv2.COLOR_BGR2GRAY)
+                    max_val = self.match_debuff(debuff_name, template, screen_np, gray_screen, band)
+                self.last_scores[debuff_name] = float(max_val)
+                states[debuff_name] = max_val >= self.threshold
+
+            except cv2.error as cv2_err:
+                 # Handle specific OpenCV errors, e.g., template larger than image after grab
+                 self.errors += 1
+                 print(f"OpenCV Error during detection [{self.category_name} - {debuff_name}]: {cv2_err}")
+                 states[debuff_name] = False # Assume not detected if OpenCV error occurs
+            except Exception as e:
+                self.errors += 1
+                print(f"Detection error [{self.category_name} - {debuff_name}]: {str(e)}")
+                states[debuff_name] = False
+        return states
+
+    def stats(self):
+        """Counters for the frame-change gate and template matching."""
+        return {
+            'frames': self.change_gate.frames,
+            'skipped_frames': self.change_gate.skipped_frames,
+            'partial_frames': self.change_gate.partial_frames,
+            'skipped_matches': self.skipped_matches,
+            'present_slots': dict(self.present_slots),
+            'partial_matches': self.partial_matches,
+            'full_matches': self.full_matches,
+            'errors': self.errors,
+        }
+
+    def accumulate_changes(self, changed_band):
+        """Adds this tick's changed rows to the pending band of every cached debuff."""
+        if changed_band[0] == changed_band[1]:
+            return
+        for name, band in self.pending_bands.items():
+            if band[0] == band[1]:
+                self.pending_bands[name] = changed_band
+            else:
+                self.pending_bands[name] = (min(band[0], changed_band[0]), max(band[1], changed_band[1]))
+
+    def can_reuse_match(self, name, template, screen_np, changed_band):
+        """True if the cached score for name is still valid for an unchanged frame."""
+        cached = self.match_cache.get(name)
+        return (cached is not None and cached[0] is template and changed_band[0] == changed_band[1] and
+                cached[1].shape == (screen_np.shape[0] - template.shape[0] + 1,
+                                    screen_np.shape[1] - template.shape[1] + 1))
+
+    def match_debuff_timed(self, *args):
+        """match_debuff on a pool thread, adding the thread's CPU time to pool_cpu_s."""
+        start = time.thread_time()
+        try:
+            return self.match_debuff(*args)
+        finally:
+            with self._counter_lock:
+                self.pool_cpu_s += time.thread_time() - start
+
+    def take_pool_cpu(self):
+        """Returns and resets the CPU seconds match threads spent since the last call."""
+        with self._counter_lock:
+            cpu, self.pool_cpu_s = self.pool_cpu_s, 0.0
+        return cpu
+
+    def match_debuff(self, name, template, screen_np, gray_screen, changed_band):
+        """Returns the best TM_CCOEFF_NORMED score for template.
+
+        The full result map is cached per debuff. changed_band is the band of rows that
+        changed since this debuff was last matched. If it is empty the cached score is
+        returned; otherwise only the result rows whose template window overlaps that
+        band are recomputed.
+        """
+        th, tw = template.shape[:2]
+        cached = self.match_cache.get(name)
+        if self.can_reuse_match(name, template, screen_np, changed_band):
+            with self._counter_lock:
+                self.skipped_matches += 1
+            return cached[2]
+
+        res_shape = (screen_np.shape[0] - th + 1, screen_np.shape[1] - tw + 1)
+        if cached is not None and cached[0] is template and cached[1].shape == res_shape:
+            res = cached[1]
+            start = max(changed_band[0] - th + 1, 0)
+            stop = min(changed_band[1], res_shape[0]) # Exclusive end of affected result rows
+            res[start:stop] = cv2.matchTemplate(gray_screen[start:stop + th - 1], template, cv2.TM_CCOEFF_NORMED)
+            with self._counter_lock:
+                self.partial_matches += 1
+        else:
+            res = cv2.matchTemplate(gray_screen, template, cv2.TM_CCOEFF_NORMED)
+            with self._counter_lock:
+                self.full_matches += 1
+
+        _, max_val, _, _ = cv2.minMaxLoc(res)
+        self.match_cache[name] = (template, res, max_val)
+        self.pending_bands[name] = (0, 0)
+        self.batch_cache.pop(name, None) # Its score predates this match
+        return max_val
+
+    def match_parallel(self, screen_np, due):
+        """Runs match_debuff for every due template on the match thread pool.
+
+        Returns {name: score}; a template whose match raised maps to the exception.
+        Each template only touches its own cache entries, so the calls are independent.
+        """
+        gray_screen = cv2.cvtColor(screen_np, cv2.COLOR_BGR2GRAY)
+        futures = []
+        for debuff in self.debuffs:
+            name = debuff['name']
+            if not debuff.get('enabled', True) or name not in due:
+                continue
+            template = template_bank.get(debuff['detect_image'])
+            if template is None or template.shape[0] > screen_np.shape[0] or template.shape[1] > screen_np.shape[1]:
+                continue
+            band = self.pending_bands.get(name, (0, screen_np.shape[0]))
+            futures.append((name, self.executor.submit(self.match_debuff_timed, name, template, screen_np, gray_screen,
+                                                       band)))
+        scores = {}
+        for name, future in futures:
+            try:
+                scores[name] = future.result()
+            except Exception as e:
+                scores[name] = e
+        return scores
+
+    def match_selection(self, screen_np, due, anchor_row=None):
+        """Scores the due debuffs with the batched, slot or pyramid matcher.
+
+        Debuffs whose rows haven't changed since their last match reuse their cached
+        score. anchor_row is the anchor's row in screen_np, used to place the slot
+        grid. Returns None if the slot grid can't be found, in which case the
+        standard matcher runs for this tick.
+        """
+        templates = []
+        for debuff in self.debuffs:
+            if not debuff.get('enabled', True) or debuff['name'] not in due:
+                continue
+            template = template_bank.get(debuff['detect_image'])
+            if template is not None:
+                templates.append((debuff['name'], template))
+
+        scores, stale = {}, []
+        for name, template in templates:
+            cached = self.batch_cache.get(name)
+            band = self.pending_bands.get(name, (0, 1))
+            if cached is not None and cached[0] is template and band[0] == band[1]:
+                scores[name] = cached[1]
+            else:
+                stale.append((name, template))
+        self.skipped_matches += len(scores)
+        if not stale:
+            return scores
+
+        gray_screen = cv2.cvtColor(screen_np, cv2.COLOR_BGR2GRAY)
+        if self.match_mode == 'slots':
+            result = self.slot_classifier.classify(gray_screen, stale, anchor_row)
+            if result is None:
+                self.batch_cache.clear()
+                return None
+            new_scores, new_slots = result
+            matched = {name for name, _ in stale}
+            self.present_slots = {name: slots for name, slots in self.present_slots.items() if name not in matched}
+            self.present_slots.update(new_slots)
+        elif self.match_mode == 'pyramid':
+            new_scores = self.pyramid_matcher.match(gray_screen, stale)
+        else:
+            new_scores = self.batched_matcher.match(gray_screen, stale)
+        self.full_matches += len(new_scores)
+        for name, template in stale:
+            if name in new_scores:
+                self.batch_cache[name] = (template, new_scores[name])
+                self.pending_bands[name] = (0, 0)
+                self.match_cache.pop(name, None) # Its result map predates this score
+        scores.update(new_scores)
+        return scores
+
+# --- Detection Scheduler ---
+class CpuGovernor:
+    """Keeps the tracker's CPU use under cpu_budget_percent by slowing detection down.
+
+    The cap is a share of one core (5 = 5%). Only detection's own CPU time counts:
+    the scheduler passes the thread time of each screen grab and each tick
+    (including match threads) to add_cpu(), and so does DetectionWorkerPool for
+    the worker processes; GUI repaints, the metrics server and the profiler
+    don't throttle detection. OpenCV's internal threads aren't seen. The
+    scheduler calls update() after each batch of ticks; once per period it
+    compares the CPU time added since the last check with the cap. Over the cap, every category's tick rate and every
+    debuff's poll interval is scaled down one step (x0.75, no lower than
+    min_scale). Once usage has stayed under 60% of the cap for three checks the
+    scale goes back up a step, so it doesn't flap around the cap.
+
+    With no cap (0) usage is still measured, for the stats.
+    """
+    STEP = 0.75
+    HEADROOM = 0.6 # Fraction of the cap usage must stay under before rates go back up
+    CALM_CHECKS = 3
+
+    def __init__(self, cap_percent=0.0, min_scale=0.25, period=1.0):
+        self.cap = max(float(cap_percent or 0.0), 0.0) / 100.0
+        self.min_scale = min(max(float(min_scale), 0.01), 1.0)
+        self.period = period
+        self.level = 0 # Steps below full rate
+        self.usage = 0.0 # Fraction of one core over the last check
+        self.adjustments = 0
+        self._calm = 0
+        self._cpu = 0.0 # Detection CPU seconds since the last check
+        self._lock = threading.Lock()
+        self._last_wall = time.monotonic()
+
+    @property
+    def scale(self):
+        return max(self.STEP ** self.level, self.min_scale)
+
+    def restart(self):
+        """Starts a fresh measurement, so startup work isn't counted against the cap."""
+        with self._lock:
+            self._cpu = 0.0
+        self._last_wall = time.monotonic()
+
+    def add_cpu(self, seconds):
+        """Counts detection CPU time (a grab, a tick or a worker job) against the cap."""
+        with self._lock:
+            self._cpu += seconds
+
+    def update(self):
+        """Measures usage once per period. Returns the new rate scale if it changed, else None."""
+        now = time.monotonic()
+        if now - self._last_wall < self.period:
+            return None
+        with self._lock:
+            cpu, self._cpu = self._cpu, 0.0
+        self.usage = cpu / (now - self._last_wall)
+        self._last_wall = now
+        if not self.cap:
+            return None
+        scale = self.scale
+        if self.usage > self.cap:
+            self._calm = 0
+            if scale > self.min_scale:
+                self.level += 1
+        elif self.usage < self.cap * self.HEADROOM and self.level:
+            self._calm += 1
+            if self._calm >= self.CALM_CHECKS:
+                self._calm = 0
+                self.level -= 1
+        else:
+            self._calm = 0
+        if self.scale == scale:
+            return None
+        self.adjustments += 1
+        print(f"CPU governor: usage {self.usage * 100:.1f}% of a core, cap {self.cap * 100:g}%, "
+              f"detection rates now x{self.scale:.2f}")
+        return self.scale
+
+    def stats(self):
+        return {
+            'cap_percent': round(self.cap * 100.0, 2),
+            'usage_percent': round(self.usage * 100.0, 2),
+            'rate_scale': round(self.scale, 3),
+            'throttled': self.level > 0,
+            'adjustments': self.adjustments,
+        }
+
+class DetectionScheduler:
+    """Runs every category's detection tick on fixed deadlines from one thread.
+
+    Owned by DebuffTracker. Deadlines lie on a grid of whole periods from one shared
+    epoch, so categories with the same rate always come due together and read the
+    same captured frame. A tick that starts late, but by less than a period, keeps
+    its place on the grid and the next one comes sooner. When whole periods are
+    missed those ticks are dropped instead of being run back to back on one frame.
+
+    While a category's anchor is enabled but not found it is ticked at
+    anchor_poll_hz, and its tick only checks the anchor. wake() brings the next
+    tick forward as soon as the anchor is back.
+
+    The governor (a CpuGovernor) scales every category's rate down while the
+    app uses more CPU than its budget; anchor polling is left alone.
+    """
+    def __init__(self, capture_service, anchor_poll_hz=1.0, coalesce=0.002, governor=None):
+        self.capture_service = capture_service
+        self.anchor_poll_hz = max(float(anchor_poll_hz), 0.1)
+        self.governor = governor or CpuGovernor()
+        self.coalesce = coalesce # Deadlines this close together share one frame
+        self._entries = {} # engine -> schedule state
+        self._condition = threading.Condition()
+        self._run_lock = threading.Lock() # Held while ticks run, so remove() can wait one out
+        self._epoch = time.monotonic()
+        self._running = False
+        self._thread = None
+        self.frames = 0
+
+    def add(self, engine, rate_hz=4.0):
+        """Schedules engine.detection_tick(frame) at rate_hz, starting now."""
+        with self._condition:
+            self._entries[engine] = {
+                'rate': max(float(rate_hz), 0.1),
+                'period': None, # Period the current deadline was placed with
+                'anchor_polling': False,
+                'deadline': time.monotonic(),
+                'last_start': None,
+                'ticks': 0,
+                'dropped': 0,
+                'actual_hz': 0.0, # Exponential moving averages
+                'jitter_ms': 0.0,
+                'max_jitter_ms': 0.0,
+            }
+            engine.rate_scale = self.governor.scale
+            if not self._running:
+                self._running = True
+                self.governor.restart()
+                self._thread = threading.Thread(target=self._run, name="DetectionScheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, engine):
+        """Unschedules engine. Returns after any tick of it that is in progress."""
+        with self._condition:
+            self._entries.pop(engine, None)
+        if threading.current_thread() is not self._thread:
+            with self._run_lock:
+                pass
+
+    def set_rate(self, engine, rate_hz):
+        with self._condition:
+            entry = self._entries.get(engine)
+            if entry is not None:
+                entry['rate'] = max(float(rate_hz), 0.1)
+                self._condition.notify()
+
+    def wake(self, engine):
+        """Makes engine due now, e.g. when its anchor came back during slow polling."""
+        with self._condition:
+            entry = self._entries.get(engine)
+            if entry is not None:
+                entry['deadline'] = min(entry['deadline'], time.monotonic())
+                self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    @staticmethod
+    def anchor_polling(engine):
+        """True while engine waits for its anchor and only needs the slow anchor poll."""
+        return bool(engine.anchor_detection_enabled and engine.anchor_image_path and not engine.anchor_found)
+
+    def next_grid_deadline(self, after, period):
+        """First deadline on period's grid strictly after `after`."""
+        return self._epoch + (math.floor((after - self._epoch) / period) + 1) * period
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    if not self._entries:
+                        self._condition.wait()
+                        continue
+                    wait = min(e['deadline'] for e in self._entries.values()) - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                if not self._running:
+                    return
+                cutoff = time.monotonic() + self.coalesce
+                due = [(w, e) for w, e in self._entries.items() if e['deadline'] <= cutoff]
+            with self._run_lock:
+                self._tick(due)
+            scale = self.governor.update()
+            if scale is not None:
+                self.apply_rate_scale(scale)
+
+    def apply_rate_scale(self, scale):
+        """Scales every category's tick rate and poll intervals; the next deadlines snap to the new grid."""
+        with self._condition:
+            for engine in self._entries:
+                engine.rate_scale = scale
+            self._condition.notify()
+
+    def _tick(self, due):
+        """Grabs one frame for every due category and runs their ticks on it."""
+        grab_cpu = time.thread_time()
+        try:
+            frame = self.capture_service.get_frame(max_age=0) # Always a fresh grab
+        except Exception as e:
+            print(f"Scheduler capture error: {e}")
+            frame = None # Each tick handles the missing frame like a failed grab
+        self.frames += 1
+        self.governor.add_cpu(time.thread_time() - grab_cpu)
+
+        for engine, entry in due:
+            if engine not in self._entries:
+                continue # Removed while this batch was being collected
+            start = time.monotonic()
+            try:
+                backoff = engine.detection_tick(frame)
+            except Exception as e:
+                print(f"Detection tick error [{engine.category_name}]: {e}")
+                engine.metrics.count('errors')
+                backoff = 1.0 # Avoid spinning on continuous errors
+            self.governor.add_cpu(engine.last_tick_cpu_s)
+            with self._condition:
+                self._reschedule(engine, entry, start, backoff)
+
+    def _reschedule(self, engine, entry, start, backoff):
+        """Records timing for a finished tick and places the next deadline. Called with the condition held."""
+        deadline = entry['deadline']
+        lateness_ms = max(start - deadline, 0.0) * 1000.0
+        entry['ticks'] += 1
+        entry['jitter_ms'] += (lateness_ms - entry['jitter_ms']) * 0.1
+        entry['max_jitter_ms'] = max(entry['max_jitter_ms'], lateness_ms)
+        if entry['last_start'] is not None and start > entry['last_start']:
+            rate = 1.0 / (start - entry['last_start'])
+            entry['actual_hz'] = rate if entry['ticks'] == 2 else entry['actual_hz'] + (rate - entry['actual_hz']) * 0.1
+        entry['last_start'] = start
+
+        entry['anchor_polling'] = self.anchor_polling(engine)
+        if entry['anchor_polling']:
+            period = 1.0 / self.anchor_poll_hz
+        else:
+            period = 1.0 / (entry['rate'] * self.governor.scale)
+        if entry['period'] != period:
+            # First tick, rate change or anchor state change: snap to the new grid
+            next_deadline = self.next_grid_deadline(start, period)
+        else:
+            next_deadline = deadline + period
+            if start - deadline >= period: # Whole periods missed
+                entry['dropped'] += int((start - deadline) // period)
+                engine.metrics.count('missed_deadlines', int((start - deadline) // period))
+                next_deadline = self.next_grid_deadline(start, period)
+        if backoff:
+            next_deadline = max(next_deadline, self.next_grid_deadline(start + backoff, period))
+        entry['period'] = period
+        entry['deadline'] = next_deadline
+
+    def stats(self, engine):
+        """Target and actual rate, jitter (lateness of tick starts) and dropped ticks for engine."""
+        with self._condition:
+            entry = self._entries.get(engine)
+            if entry is None:
+                return None
+            return {
+                'target_hz': round(entry['rate'] * self.governor.scale, 2),
+                'actual_hz': round(entry['actual_hz'], 2),
+                'anchor_polling': entry['anchor_polling'],
+                'ticks': entry['ticks'],
+                'dropped': entry['dropped'],
+                'jitter_ms': round(entry['jitter_ms'], 2),
+                'max_jitter_ms': round(entry['max_jitter_ms'], 2),
+            }
+
+# --- Detection Worker Processes ---
+def detection_worker(jobs, results, workdir, stats_interval=1.0):
+    """Entry point of a detection worker process (see DetectionWorkerPool).
+
+    Keeps one CategoryMatcher and last-state dict per category it is given. Frames
+    are read straight out of the shared memory blocks named in each job; only
+    state changes (and, at most every stats_interval seconds, the matcher
+    counters) go back.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is the Qt process's to handle; it stops us
+    os.chdir(workdir) # images/ is resolved relative to the working directory
+    matchers, states, blocks = {}, {}, {}
+    stats_sent = {} # category id -> time its matcher counters were last sent
+    last_cpu = time.process_time()
+    while True:
+        message = jobs.get()
+        kind = message[0]
+        if kind == 'stop':
+            break
+        try:
+            if kind == 'configure':
+                _, category_id, category_config, debuffs, match_threads = message
+                if category_id in matchers:
+                    matchers[category_id].close()
+                matchers[category_id] = CategoryMatcher(category_config, debuffs, match_threads=match_threads)
+                states[category_id] = {}
+            elif kind == 'remove':
+                if message[1] in matchers:
+                    matchers.pop(message[1]).close()
+                states.pop(message[1], None)
+                stats_sent.pop(message[1], None)
+            elif kind == 'reset':
+                states[message[1]] = {}
+                if message[1] in matchers:
+                    matchers[message[1]].reset()
+            elif kind == 'invalidate':
+                for filename in message[1]:
+                    template_bank.invalidate(filename)
+            elif kind == 'detach':
+                for name in message[1]:
+                    block = blocks.pop(name, None)
+                    if block is not None:
+                        block.close()
+            elif kind == 'match':
+                _, category_id, epoch, timestamp, location, due, anchor_row = message
+                block_name, shape, (x, y, w, h) = location
+                matcher = matchers.get(category_id)
+                changes, stats, match_ms = [], None, None
+                if matcher is not None:
+                    block = blocks.get(block_name)
+                    if block is None:
+                        # Spawned workers share the Qt process's resource tracker, so attaching
+                        # doesn't register the block a second time
+                        block = blocks[block_name] = shared_memory.SharedMemory(name=block_name)
+                    image = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+                    due = set(due)
+                    start = time.perf_counter()
+                    detected = matcher.detect(image[y:y + h, x:x + w], due, anchor_row)
+                    if due:
+                        match_ms = (time.perf_counter() - start) * 1000.0 / len(due)
+                    not_due = {d['name'] for d in matcher.debuffs} - due
+                    changes = diff_detection_states(states[category_id], detected, not_due)
+                    now = time.monotonic()
+                    if now - stats_sent.get(category_id, -stats_interval) >= stats_interval:
+                        stats_sent[category_id] = now
+                        stats = matcher.stats()
+                scores = {name: matcher.last_scores.get(name) for name, _ in changes}
+                cpu = time.process_time() # Whole process, so match_threads are counted too
+                results.put((category_id, epoch, timestamp, changes, scores, stats, match_ms, cpu - last_cpu))
+                last_cpu = cpu
+        except Exception as e:
+            print(f"Detection worker error ({kind}): {e}")
+            if kind == 'match':
+                results.put((message[1], message[2], message[3], [], {}, None, None, 0.0)) # Frees the frame slot
+    for block in blocks.values():
+        block.close()
+
+class DetectionWorkerPool:
+    """Runs category matching in worker processes, fed through shared memory.
+
+    Optional (execution_mode 'process'), so the matching loop doesn't share the
+    GIL with the GUI thread or with other categories. Each tick the scheduler
+    thread copies a captured group into a ring of SharedMemory blocks once (one
+    memcpy per group and frame, about 4 us for a 903x25 buff column); every
+    category reading that group gets the block name and its sub-rect, and the
+    worker maps it as a NumPy array, so no pixels are pickled. Each category stays
+    on one worker for its lifetime, where its CategoryMatcher (and the worker's
+    template bank) persist. Workers send back only state changes; a listener
+    thread here passes them to the category's DetectionEngine subscribers.
+
+    A category with a job still in flight is skipped for that tick instead of
+    queueing behind itself.
+
+    Workers report the CPU time each job cost; it goes to governor.add_cpu().
+
+    The listener also checks that the workers are alive. A worker that died is
+    started again and its categories are configured on it afresh (their jobs in
+    flight are dropped); after MAX_RESTARTS its categories go back to matching
+    on threads in this process.
+    """
+    RING_SIZE = 4 # Frame blocks per group rect; a block is reused once no job reads it
+    CHECK_INTERVAL = 0.5 # Seconds between checks that the workers are alive
+    MAX_RESTARTS = 3 # Per worker
+
+    def __init__(self, workers, governor=None):
+        self.governor = governor
+        self._context = multiprocessing.get_context('spawn') # No forked Qt state, same on every OS
+        self._results = self._context.Queue()
+        self._workers = []
+        for i in range(max(1, int(workers))):
+            process, jobs = self._spawn(f"DetectionWorker-{i}")
+            self._workers.append({'process': process, 'jobs': jobs, 'categories': 0, 'restarts': 0,
+                                  'retired': False})
+        self._categories = {} # category id -> {'engine', 'worker', 'epoch', 'slot', 'grab_ms', 'config'}
+        self._ids = {} # engine -> category id
+        self._next_id = 0
+        self._rings = {} # group rect -> {'blocks', 'refs', 'next', 'published'}
+        self._lock = threading.Lock()
+        self.dispatched = 0
+        self.busy_skips = 0
+        self.results = 0
+        self.restarts = 0
+        self._closing = False
+        self._listener = threading.Thread(target=self._listen, name="DetectionResults", daemon=True)
+        self._listener.start()
+
+    def _spawn(self, name):
+        jobs = self._context.Queue()
+        process = self._context.Process(target=detection_worker, args=(jobs, self._results, os.getcwd()),
+                                        name=name, daemon=True)
+        process.start()
+        return process, jobs
+
+    @property
+    def worker_count(self):
+        return len(self._workers)
+
+    def register(self, engine, category_config, debuffs, match_threads=1):
+        """Hands a category to the least loaded worker (or reconfigures it on its current one).
+
+        Returns False if no worker is left to take a new category.
+        """
+        with self._lock:
+            category_id = self._ids.get(engine)
+            if category_id is None:
+                workers = [w for w in self._workers if not w['retired']]
+                if not workers:
+                    return False
+                category_id = self._next_id
+                self._next_id += 1
+                worker = min(workers, key=lambda w: w['categories'])
+                worker['categories'] += 1
+                self._ids[engine] = category_id
+                self._categories[category_id] = {'engine': engine, 'worker': worker, 'epoch': 0, 'slot': None,
+                                                 'grab_ms': 0.0}
+            category = self._categories[category_id]
+            category['epoch'] += 1 # Results for the old configuration are stale
+            category['config'] = (dict(category_config), list(debuffs), match_threads) # Sent again after a restart
+            category['worker']['jobs'].put(('configure', category_id, *category['config']))
+            return True
+
+    def unregister(self, engine):
+        with self._lock:
+            category_id = self._ids.pop(engine, None)
+            if category_id is None:
+                return
+            category = self._categories.pop(category_id)
+            category['worker']['categories'] -= 1
+            category['worker']['jobs'].put(('remove', category_id))
+            self._release(category)
+
+    def reset(self, engine):
+        """Clears engine's detection state here and in its worker, dropping results in flight."""
+        with self._lock:
+            category_id = self._ids.get(engine)
+            if category_id is None:
+                return
+            category = self._categories[category_id]
+            category['epoch'] += 1
+            category['worker']['jobs'].put(('reset', category_id))
+            # Under the lock, so a late result can't re-detect something after this
+            gone = [name for name, detected in engine.last_detection_state.items() if detected]
+            for name in gone:
+                engine.last_detection_state[name] = False
+            engine.apply_detection_changes([(name, False) for name in gone])
+
+    def submit(self, engine, frame, rect, due, anchor_row):
+        """Queues matching of rect in frame for engine. Returns False if the tick was skipped."""
+        with self._lock:
+            category_id = self._ids.get(engine)
+            if category_id is None:
+                return False
+            category = self._categories[category_id]
+            if category['slot'] is not None:
+                self.busy_skips += 1 # Previous job still running
+                return False
+            location = self._publish(frame, rect)
+            if location is None:
+                self.busy_skips += 1
+                return False
+            category['slot'] = location[0]
+            category['grab_ms'] = frame.grab_ms # For the latency trace of the result
+            self.dispatched += 1
+            category['worker']['jobs'].put(('match', category_id, category['epoch'], frame.timestamp,
+                                            location[1], sorted(due), anchor_row))
+            return True
+
+    def _publish(self, frame, rect):
+        """Returns ((ring, index), (block name, shape, sub-rect)) for rect in frame, copying its group once.
+
+        Called with the lock held.
+        """
+        for group_rect, image in frame.regions:
+            if rect_contains(group_rect, rect):
+                break
+        else:
+            return None
+        ring = self._rings.get(group_rect)
+        if ring is None or ring['blocks'][0][1] != image.shape:
+            if ring is not None:
+                self._drop_ring(group_rect)
+            ring = self._rings[group_rect] = {
+                'blocks': [(shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1)), image.shape)
+                           for _ in range(self.RING_SIZE)],
+                'refs': [0] * self.RING_SIZE,
+                'next': 0,
+                'published': None, # (frame timestamp, index) of the last copy
+            }
+        published = ring['published']
+        if published is not None and published[0] == frame.timestamp:
+            index = published[1]
+        else:
+            for step in range(self.RING_SIZE):
+                index = (ring['next'] + step) % self.RING_SIZE
+                if ring['refs'][index] == 0:
+                    break
+            else:
+                return None # Every block is still being read
+            block, shape = ring['blocks'][index]
+            np.copyto(np.ndarray(shape, dtype=np.uint8, buffer=block.buf), image)
+            ring['next'] = (index + 1) % self.RING_SIZE
+            ring['published'] = (frame.timestamp, index)
+        ring['refs'][index] += 1
+        block, shape = ring['blocks'][index]
+        sub_rect = (rect[0] - group_rect[0], rect[1] - group_rect[1], rect[2], rect[3])
+        return (group_rect, index), (block.name, shape, sub_rect)
+
+    def _release(self, category):
+        """Frees the frame block category's job was reading. Called with the lock held."""
+        slot = category['slot']
+        category['slot'] = None
+        if slot is not None:
+            ring = self._rings.get(slot[0])
+            if ring is not None and ring['refs'][slot[1]] > 0:
+                ring['refs'][slot[1]] -= 1
+
+    def _drop_ring(self, group_rect):
+        """Unlinks a group's blocks, e.g. after its rect or frame shape changed. Called with the lock held."""
+        ring = self._rings.pop(group_rect)
+        names = [block.name for block, _ in ring['blocks']]
+        for worker in self._workers:
+            worker['jobs'].put(('detach', names))
+        for block, _ in ring['blocks']:
+            block.close()
+            block.unlink()
+
+    def _listen(self):
+        next_check = time.monotonic() + self.CHECK_INTERVAL
+        while True:
+            try:
+                message = self._results.get(timeout=self.CHECK_INTERVAL)
+            except queue.Empty:
+                message = False
+            if message is None:
+                return
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.CHECK_INTERVAL
+            if message is False:
+                continue
+            category_id, epoch, timestamp, changes, scores, stats, match_ms, cpu_s = message
+            if self.governor is not None:
+                self.governor.add_cpu(cpu_s)
+            with self._lock:
+                self.results += 1
+                category = self._categories.get(category_id)
+                if category is None:
+                    continue
+                self._release(category)
+                if epoch != category['epoch']:
+                    continue # Reset or reconfigured since this job was sent
+                engine = category['engine']
+                if match_ms is not None:
+                    engine.metrics.record('match_ms_per_debuff', match_ms)
+                if stats is not None:
+                    engine.worker_stats = stats
+                for name, detected in changes:
+                    engine.last_detection_state[name] = detected # Mirror of the worker's state
+                engine.apply_detection_changes(changes, timestamp, category['grab_ms'], scores)
+
+    def _check_workers(self):
+        """Restarts dead workers, or retires them after MAX_RESTARTS and moves their categories to threads."""
+        fallback = []
+        with self._lock:
+            if self._closing:
+                return
+            for worker in self._workers:
+                process = worker['process']
+                if worker['retired'] or process.is_alive():
+                    continue
+                categories = [(category_id, category) for category_id, category in self._categories.items()
+                              if category['worker'] is worker]
+                for _, category in categories:
+                    self._release(category) # Its job will never report back
+                    category['epoch'] += 1
+                if worker['restarts'] < self.MAX_RESTARTS:
+                    worker['restarts'] += 1
+                    self.restarts += 1
+                    print(f"{process.name} exited (code {process.exitcode}), restarting it "
+                          f"({worker['restarts']}/{self.MAX_RESTARTS})")
+                    worker['process'], worker['jobs'] = self._spawn(process.name)
+                    for category_id, category in categories:
+                        worker['jobs'].put(('configure', category_id, *category['config']))
+                else:
+                    print(f"{process.name} exited (code {process.exitcode}) after {self.MAX_RESTARTS} restarts, "
+                          f"matching its {len(categories)} categories on threads")
+                    worker['retired'] = True
+                    fallback.extend(category['engine'] for _, category in categories)
+        for engine in fallback:
+            with engine.tick_lock: # Not while holding our lock, run_tick takes it inside tick_lock
+                self.unregister(engine)
+                engine.worker_pool = None
+
+    def invalidate_templates(self, filenames):
+        """Makes every worker decode these images again (they changed on disk)."""
+        for worker in self._workers:
+            worker['jobs'].put(('invalidate', list(filenames)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'alive': sum(w['process'].is_alive() for w in self._workers),
+                'restarts': self.restarts,
+                'dispatched': self.dispatched,
+                'results': self.results,
+                'busy_skips': self.busy_skips,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closing = True # Stopped workers aren't restarted
+        for worker in self._workers:
+            worker['jobs'].put(('stop',))
+        for worker in self._workers:
+            worker['process'].join(timeout=1.0)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+        self._results.put(None)
+        self._listener.join(timeout=1.0)
+        with self._lock:
+            for group_rect in list(self._rings):
+                ring = self._rings.pop(group_rect)
+                for block, _ in ring['blocks']:
+                    block.close()
+                    block.unlink()
+
+# --- Detection Engine ---
+class DetectionEngine:
+    """Detection for one category, independent of any widget.
+
+    Resolves the anchor, picks the debuffs due on each frame and matches them,
+    here through a CategoryMatcher or in a DetectionWorkerPool when one is given.
+    Only changes are passed on: every subscriber's on_diff(DetectionDiff), once per
+    tick with changes, and on_anchor(found) are called from the thread that ran the
+    tick. CategoryWindow queues the diffs for its GUI thread; `main.py --headless`
+    drives engines without Qt.
+    """
+    def __init__(self, category_config, debuffs, capture_service, anchor_resolver,
+                 scheduler=None, worker_pool=None, match_threads=1, threshold=0.8):
+        self.category_config = category_config
+        self.category_name = category_config['name']
+        self.debuffs = debuffs
+        self.capture_service = capture_service
+        self.anchor_resolver = anchor_resolver
+        self.scheduler = scheduler # None when frames are fed through process_frame()
+        self.worker_pool = worker_pool # Matches in worker processes instead when set
+        self.match_threads = match_threads
+        self.match_mode = category_config.get('match_mode', 'standard').lower()
+        self.matcher = CategoryMatcher(category_config, debuffs, threshold, match_threads) # Used in thread mode
+
+        self.region_lock = threading.Lock()
+        self.tick_lock = threading.Lock() # Held for a whole tick, so reconfigure() lands between ticks
+        self.screen_region = (category_config['x'], category_config['y'],
+                              category_config['width'], category_config['height'])
+        self.anchor_region = (category_config.get('anchor_x', 0), category_config.get('anchor_y', 0),
+                              category_config.get('anchor_width', 0), category_config.get('anchor_height', 0))
+        self.anchor_detection_enabled = category_config.get('anchor_detection_enabled', False)
+        self.anchor_image_path = category_config.get('anchor_image', '')
+        self.anchor_found = False
+
+        self.worker_stats = {} # Latest matcher counters reported by the worker
+        self.deferred_matches = 0 # Debuffs not due on a tick
+        self.last_tick_cpu_s = 0.0 # CPU time of the last detection_tick, for the CPU governor
+        self.last_frame_timestamp = None
+        self.last_detection_state = {} # debuff name -> last emitted state
+        self.detection_rate_hz = category_config.get('detection_rate_hz', 4.0)
+        self.poll_intervals = self.resolve_poll_intervals() # debuff name -> seconds between matches
+        self.tick_rate_hz = max([self.detection_rate_hz] + [1.0 / i for i in self.poll_intervals.values()])
+        self.last_polled = {} # debuff name -> frame timestamp of its last match
+        self.rate_scale = 1.0 # Set by the scheduler's CPU governor
+        self.metrics = CategoryMetrics()
+        self.diff_seq = 0 # seq of the last published DetectionDiff
+        self._subscribers = [] # (on_diff, on_anchor)
+        self.register_shared_regions()
+
+    def subscribe(self, on_diff, on_anchor=None):
+        self._subscribers.append((on_diff, on_anchor))
+
+    def unsubscribe(self, on_diff):
+        self._subscribers = [s for s in self._subscribers if s[0] != on_diff]
+
+    def start(self):
+        """Registers with the worker pool and the scheduler, if any.
+
+        The category ticks fast enough for its most frequently polled debuff; each
+        tick only matches the debuffs that are due.
+        """
+        if self.worker_pool is not None and not self.worker_pool.register(self, self.category_config, self.debuffs,
+                                                                            self.match_threads):
+            self.worker_pool = None # Every worker process died, match on threads
+        if self.scheduler is not None:
+            self.scheduler.add(self, self.tick_rate_hz)
+
+    def stop(self):
+        """Stops detection. Waits at most for one tick in progress."""
+        if self.scheduler is not None:
+            self.scheduler.remove(self)
+        if self.worker_pool is not None:
+            self.worker_pool.unregister(self)
+        self.capture_service.remove(self)
+        self.anchor_resolver.unsubscribe(self)
+        self.matcher.close() # No tick is running after scheduler.remove()
+
+    def resolve_poll_intervals(self):
+        """Returns {debuff name: seconds between matches} for the enabled debuffs.
+
+        A category's poll_intervals_ms entry wins over the debuff's poll_interval_ms
+        in debuffs.json. Either can be milliseconds or a POLL_TIERS name; debuffs
+        without one are matched at the category's detection_rate_hz.
+        """
+        overrides = self.category_config.get('poll_intervals_ms', {})
+        base = 1.0 / max(float(self.detection_rate_hz), 0.1)
+        intervals = {}
+        for debuff in self.debuffs:
+            if not debuff.get('enabled', True):
+                continue
+            name = debuff['name']
+            value = overrides.get(name, debuff.get('poll_interval_ms'))
+            if isinstance(value, str):
+                if value.lower() not in POLL_TIERS:
+                    print(f"Warning [{self.category_name}]: Unknown poll tier '{value}' for {name}.")
+                value = POLL_TIERS.get(value.lower())
+            try:
+                intervals[name] = max(float(value), 10.0) / 1000.0 if value else base
+            except (TypeError, ValueError):
+                print(f"Warning [{self.category_name}]: Invalid poll interval {value!r} for {name}.")
+                intervals[name] = base
+        return intervals
+
+    def due_debuffs(self, timestamp):
+        """Names of the debuffs whose poll interval has elapsed at frame timestamp."""
+        scale = self.rate_scale # Below 1 while the CPU governor is throttling
+        slack = 0.5 / (self.tick_rate_hz * scale) # Ticks don't land exactly on each debuff's interval
+        return {name for name, interval in self.poll_intervals.items()
+                if timestamp - self.last_polled.get(name, float('-inf')) >= interval / scale - slack}
+
+    def process_frame(self, frame):
+        """Runs one tick on frame and returns {debuff name: (detected, score)}.
+
+        For callers that feed frames themselves (headless runs, benchmarks). The
+        score is that of the debuff's last match, None before it has been matched
+        or when matching runs in worker processes.
+        """
+        self.detection_tick(frame)
+        scores = self.matcher.last_scores
+        return {name: (detected, scores.get(name)) for name, detected in self.last_detection_state.items()}
+
+    def detection_tick(self, frame):
+        """Runs one detection pass on the shared frame. Called by the DetectionScheduler.
+
+        Returns a delay in seconds to wait before the next tick after an error, or
+        None to keep the normal rate.
+        """
+        start = time.perf_counter()
+        start_cpu = time.thread_time()
+        self.metrics.tick()
+        if frame is not None:
+            self.metrics.record('grab_ms', frame.grab_ms)
+        try:
+            with self.tick_lock:
+                return self.run_tick(frame)
+        finally:
+            self.metrics.record('tick_ms', (time.perf_counter() - start) * 1000.0)
+            # This thread plus the match threads; worker processes report their own
+            self.last_tick_cpu_s = time.thread_time() - start_cpu + self.matcher.take_pool_cpu()
+            self.metrics.record('tick_cpu_ms', self.last_tick_cpu_s * 1000.0)
+
+    def run_tick(self, frame):
+        last_detection_state = self.last_detection_state # Track last known state to only emit changes
+        anchor_check_passed = False # Assume fail initially
+
+        # --- Anchor Detection ---
+        if self.anchor_detection_enabled and self.anchor_image_path:
+            try:
+                if frame is None:
+                    raise ValueError("No frame captured")
+                self.last_frame_timestamp = frame.timestamp
+                # Evaluated once per frame for every category sharing this anchor
+                anchor_check_passed = self.anchor_resolver.resolve(frame, self)
+            except Exception as e:
+                self.metrics.count('errors')
+                print(f"Anchor Detection error [{self.category_name}]: {str(e)}")
+                self.set_anchor_found(False) # If error, assume lost
+                anchor_check_passed = False
+        else:
+            # Anchor detection not enabled, always pass this check
+            anchor_check_passed = True
+        # --- End Anchor Detection ---
+
+        if not anchor_check_passed:
+            # If anchor check failed, treat all *currently tracked* debuffs as 'not detected'
+            self.clear_detection_states(frame)
+            return None
+
+        # --- Debuff Detection ---
+        with self.region_lock:
+            current_region = self.screen_region
+
+        if current_region[2] <= 0 or current_region[3] <= 0:
+            return 0.5 # Wait if region is not set
+
+        try:
+            if frame is None:
+                raise ValueError("No frame captured")
+            self.last_frame_timestamp = frame.timestamp
+            screen_np = frame.view(current_region)
+            if screen_np is None or screen_np.size == 0:
+                print(f"Warning [{self.category_name}]: Debuff ImageGrab failed (empty).")
+                raise ValueError("Empty debuff screenshot") # Treat as error
+
+            due = self.due_debuffs(frame.timestamp)
+
+        except Exception as grab_error:
+             self.metrics.count('errors')
+             print(f"Debuff ImageGrab Error [{self.category_name}]: {grab_error}")
+             # If screen grab fails, assume all debuffs are not detected for this cycle
+             self.clear_detection_states()
+             return 0.5 # Wait a bit before retrying grab
+
+        # Not due this tick: keep the last state so it isn't reported as disappeared
+        not_due = set(self.poll_intervals) - due
+        self.deferred_matches += len(not_due)
+
+        anchor_row = None
+        if self.match_mode == 'slots':
+            anchor_location = self.anchor_resolver.anchor_location(self)
+            if anchor_location is not None:
+                anchor_row = anchor_location[1] - current_region[1]
+
+        if self.worker_pool is not None:
+            # The worker keeps its own state and reports changes back through the pool
+            if self.worker_pool.submit(self, frame, current_region, due, anchor_row):
+                for name in due:
+                    self.last_polled[name] = frame.timestamp
+            return None
+
+        match_start = time.perf_counter()
+        states = self.matcher.detect(screen_np, due, anchor_row)
+        if due:
+            self.metrics.record('match_ms_per_debuff', (time.perf_counter() - match_start) * 1000.0 / len(due))
+        for name in due:
+            self.last_polled[name] = frame.timestamp
+        self.apply_detection_changes(diff_detection_states(last_detection_state, states, not_due),
+                                     frame.timestamp, frame.grab_ms)
+        return None
+
+    def apply_detection_changes(self, changes, frame_timestamp=None, grab_ms=0.0, scores=None):
+        """Publishes one tick's (name, detected) changes to the subscribers as a DetectionDiff.
+
+        Each change gets a LatencyTracer dict started from the frame it was seen
+        in, or None when there is no frame to time it from. scores maps debuff
+        names to their match score; in thread mode it defaults to the matcher's.
+        """
+        if not changes:
+            return
+        if scores is None:
+            scores = self.matcher.last_scores if self.worker_pool is None else {}
+        emitted = time.monotonic()
+        traces = []
+        for name, detected in changes:
+            trace = None
+            if frame_timestamp is not None:
+                trace = {'category': self.category_name, 'debuff': name, 'detected': detected,
+                         'frame': frame_timestamp, 'grabbed': frame_timestamp + grab_ms / 1000.0, 'emitted': emitted}
+            traces.append(trace)
+        self.diff_seq += 1
+        diff = DetectionDiff(self.category_name, self.diff_seq, frame_timestamp, tuple(changes),
+                             MappingProxyType({name: scores.get(name) for name, _ in changes}), tuple(traces))
+        for on_diff, _ in self._subscribers:
+            on_diff(diff)
+
+    def clear_detection_states(self, frame=None):
+        """Reports every detected debuff as gone, e.g. when the anchor or the grab is lost.
+
+        The matcher forgets its previous frame too, so the next match starts from scratch.
+        """
+        if self.worker_pool is not None:
+            self.worker_pool.reset(self) # Also drops results still in flight
+            return
+        self.matcher.reset()
+        gone = [name for name, detected in self.last_detection_state.items() if detected is True]
+        for debuff_name in gone:
+            self.last_detection_state[debuff_name] = False
+        if frame is not None:
+            self.apply_detection_changes([(name, False) for name in gone], frame.timestamp, frame.grab_ms)
+        else:
+            self.apply_detection_changes([(name, False) for name in gone])
+
+    def detection_stats(self):
+        """Counters for the frame-change gate and template matching."""
+        counts = dict(self.worker_stats) if self.worker_pool is not None else self.matcher.stats()
+        for key in ('frames', 'skipped_frames', 'partial_frames', 'skipped_matches', 'partial_matches', 'full_matches',
+                    'errors'):
+            counts.setdefault(key, 0)
+        counts.setdefault('present_slots', {})
+        counts['deferred_matches'] = self.deferred_matches
+        return counts
+
+    def performance(self):
+        """The rolling metrics snapshot, with the matcher's error count folded in."""
+        snapshot = self.metrics.snapshot()
+        snapshot['errors'] += self.detection_stats()['errors']
+        return snapshot
+
+    def reconfigure(self, debuffs, match_threads=None):
+        """Applies category_config (already changed in place) and a new debuff list while running.
+
+        Waits for a tick in progress, then updates regions, anchor, poll intervals
+        and the matcher in place, so only newly selected debuffs need matching from
+        scratch (their templates come from the shared template bank). Debuffs no
+        longer selected are dropped without being reported. The next tick runs
+        right away with the new settings.
+        """
+        config = self.category_config
+        with self.tick_lock:
+            self.category_name = config['name']
+            names = {d['name'] for d in debuffs}
+            for state in (self.last_detection_state, self.last_polled):
+                for name in [name for name in state if name not in names]:
+                    state.pop(name, None)
+            self.debuffs = debuffs
+            if match_threads is not None:
+                self.match_threads = match_threads
+            self.match_mode = config.get('match_mode', 'standard').lower()
+            self.matcher.reconfigure(config, debuffs, match_threads=self.match_threads)
+            self.detection_rate_hz = config.get('detection_rate_hz', 4.0)
+            self.poll_intervals = self.resolve_poll_intervals()
+            self.tick_rate_hz = max([self.detection_rate_hz] + [1.0 / i for i in self.poll_intervals.values()])
+            region = (config['x'], config['y'], config['width'], config['height'])
+            if region != self.screen_region:
+                self.matcher.reset() # Scores cached for the old region's rows don't apply
+            with self.region_lock:
+                self.screen_region = region
+                self.anchor_region = (config.get('anchor_x', 0), config.get('anchor_y', 0),
+                                      config.get('anchor_width', 0), config.get('anchor_height', 0))
+            self.anchor_detection_enabled = config.get('anchor_detection_enabled', False)
+            self.anchor_image_path = config.get('anchor_image', '')
+            self.register_shared_regions()
+            if self.worker_pool is not None:
+                # Rebuilds the worker's matcher; results still in flight are dropped
+                self.worker_pool.register(self, config, debuffs, self.match_threads)
+        if self.scheduler is not None:
+            self.scheduler.set_rate(self, self.tick_rate_hz)
+            self.scheduler.wake(self)
+
+    def register_shared_regions(self):
+        """Tells the shared capture service and anchor resolver which rects this category reads."""
+        with self.region_lock:
+            rects = [self.screen_region]
+            anchor_rect = self.anchor_region
+        if self.anchor_detection_enabled and self.anchor_image_path:
+            rects.append(anchor_rect)
+            self.anchor_resolver.subscribe(self, self.anchor_image_path, anchor_rect)
+        else:
+            self.anchor_resolver.unsubscribe(self)
+        self.capture_service.set_regions(self, rects)
+
+    def update_region(self, rect):
+        """Moves the search region to rect, an (x, y, w, h) tuple.
+
+        Detections in the old region are reported gone; the new one is matched from scratch.
+        """
+        with self.tick_lock:
+            with self.region_lock:
+                self.screen_region = rect
+            self.clear_detection_states()
+        self.register_shared_regions()
+
+    def update_anchor_region(self, rect):
+        with self.region_lock:
+            self.anchor_region = rect
+        self.register_shared_regions()
+
+    def set_anchor_found(self, found):
+        """Records the anchor state and tells the subscribers if it flipped.
+
+        Called from the scheduler thread by whichever category evaluated the shared
+        anchor this frame.
+        """
+        if found != self.anchor_found:
+            self.anchor_found = found
+            for _, on_anchor in self._subscribers:
+                if on_anchor is not None:
+                    on_anchor(found)
+            if found and self.scheduler is not None:
+                self.scheduler.wake(self) # Leave slow anchor polling now
+
+# --- RegionSelector Class ---
 class RegionSelector(QWidget):
     selection_complete = pyqtSignal(QRect)
 
@@ -106,7 +2877,7 @@ class RegionDisplayer(QWidget):
             painter.setBrush(QColor(255, 0, 0, 50))
             painter.drawRect(adj_anchor)
 
-# --- DraggableTitleBar Class (Unchanged) ---
+# --- DraggableTitleBar Class ---
 class DraggableTitleBar(QWidget):
     def __init__(self, text, parent=None):
         super().__init__(parent)
@@ -299,6 +3070,33 @@ class SettingsDialog(QDialog):
 
         layout.addLayout(display_mode_layout)
 
+        # Match Mode Selection Layout
+        match_mode_layout = QHBoxLayout()
+        match_mode_label = QLabel("Match Mode:")
+
+        self.match_mode_combo = QComboBox()
+        self.match_mode_combo.addItems(["Standard", "Batched", "Slots", "Pyramid"])
+        current_match_mode = self.category_config.get('match_mode', 'standard').capitalize()
+        self.match_mode_combo.setCurrentText(current_match_mode)
+
+        match_mode_layout.addWidget(match_mode_label)
+        match_mode_layout.addWidget(self.match_mode_combo)
+
+        layout.addLayout(match_mode_layout)
+
+        # Renderer Selection Layout
+        renderer_layout = QHBoxLayout()
+        renderer_label = QLabel("Renderer:")
+
+        self.renderer_combo = QComboBox()
+        self.renderer_combo.addItems(["Widgets", "Strip"])
+        self.renderer_combo.setCurrentText(self.category_config.get('renderer', 'widgets').capitalize())
+
+        renderer_layout.addWidget(renderer_label)
+        renderer_layout.addWidget(self.renderer_combo)
+
+        layout.addLayout(renderer_layout)
+
         # Anchor Detection Layout
         anchor_detection_layout = QHBoxLayout()
 
@@ -409,6 +3207,8 @@ class SettingsDialog(QDialog):
     def get_updated_config(self):
         self.category_config['name'] = self.name_edit.text().strip()
         self.category_config['display_mode'] = self.display_mode_combo.currentText().lower()
+        self.category_config['match_mode'] = self.match_mode_combo.currentText().lower()
+        self.category_config['renderer'] = self.renderer_combo.currentText().lower()
         self.category_config['anchor_detection_enabled'] = self.anchor_check.isChecked()
         # Sort selected debuffs to maintain order
         all_names = [d['name'] for d in self.all_debuffs]
@@ -418,53 +3218,103 @@ class SettingsDialog(QDialog):
         ]
         return self.category_config
 
-# --- DebuffIcon Class (Unchanged) ---
+# --- Icon Pixmap Cache ---
+class IconPixmapCache:
+    """LRU cache of decoded, scaled overlay icons, keyed by (icon_image, size).
+
+    GUI thread only (QPixmap). Icons flickering in and out and every window
+    showing the same debuff reuse one pixmap instead of reading and rescaling the
+    image each time. A missing image is cached as None.
+    """
+    def __init__(self, image_dir=IMAGES_DIR, capacity=256):
+        self.image_dir = Path(image_dir)
+        self.capacity = capacity
+        self._entries = OrderedDict() # (icon_image, size) -> QPixmap or None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, icon_image, size):
+        """Returns icon_image scaled to fit size x size, or None if it can't be loaded."""
+        key = (icon_image, size)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        pixmap = QPixmap(str(self.image_dir / icon_image)) if icon_image else QPixmap()
+        scaled = None
+        if not pixmap.isNull():
+            scaled = pixmap.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self._entries[key] = scaled
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return scaled
+
+    def discard(self, icon_images, size):
+        """Drops the given images at one size, e.g. the sizes an icon-size slider drag passes through."""
+        for icon_image in icon_images:
+            self._entries.pop((icon_image, size), None)
+
+    def invalidate(self, icon_image=None):
+        """Drops every size of one image (or everything) so it is read from disk again."""
+        if icon_image is None:
+            self._entries.clear()
+        else:
+            for key in [key for key in self._entries if key[0] == icon_image]:
+                del self._entries[key]
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+icon_pixmaps = IconPixmapCache()
+
+# --- DebuffIcon Class ---
 class DebuffIcon(QLabel):
+    STYLE = """
+            background-color: rgba(30, 30, 30, 150);
+            border: 2px solid rgba(255, 255, 255, 100);
+            border-radius: 0px;
+        """
+    MISSING_STYLE = """
+                background-color: rgba(30, 30, 30, 150);
+                border: 2px solid rgba(255, 0, 0, 150);
+                border-radius: 5px;
+                color: white;
+                font: bold 20px;
+            """
+
     def __init__(self, debuff_data, initial_size=48):
         super().__init__()
         self.debuff_data = debuff_data
         self.current_size = initial_size
+        self.missing = False # Showing the letter fallback
         self.setFixedSize(self.current_size, self.current_size)
-        self.setStyleSheet("""
-            background-color: rgba(30, 30, 30, 150);
-            border: 2px solid rgba(255, 255, 255, 100);
-            border-radius: 0px;
-        """)
+        self.setStyleSheet(self.STYLE)
         self.setAlignment(Qt.AlignCenter)
 
         # Add opacity effect
         self.opacity_effect = QGraphicsOpacityEffect(self)
         self.setGraphicsEffect(self.opacity_effect)
         self.set_opacity(1.0) # Start fully opaque
+        self.pending_traces = [] # Latency traces finished by the next paint
 
         self.update_icon()
 
     def update_icon(self):
         """Updates the icon pixmap or text."""
-        try:
-            pixmap = QPixmap(f"images/{self.debuff_data['icon_image']}")
-            if pixmap.isNull():
-                # print(f"Warning: Icon image not found: images/{self.debuff_data['icon_image']}") # Optional warning
-                raise FileNotFoundError
-            self.setPixmap(pixmap.scaled(self.current_size - 2, self.current_size - 2, Qt.KeepAspectRatio, Qt.SmoothTransformation)) # scale down a bit from the label size.
-            # Clear text if pixmap is successfully loaded
-            self.setText("")
-            # Reset stylesheet if needed (in case it was set to error state before)
-            self.setStyleSheet("""
-                background-color: rgba(30, 30, 30, 150);
-                border: 2px solid rgba(255, 255, 255, 100);
-                border-radius: 0px;
-            """)
-        except Exception as e:
+        # Scaled down a bit from the label size
+        pixmap = icon_pixmaps.get(self.debuff_data.get('icon_image', ''), self.current_size - 2)
+        if pixmap is not None:
+            self.setPixmap(pixmap)
+            if self.missing: # Stylesheets are only re-parsed when the state flips
+                self.missing = False
+                self.setStyleSheet(self.STYLE)
+        else:
             # Display first letter as fallback
             self.setText(self.debuff_data.get('name', '?')[0])
-            self.setStyleSheet("""
-                background-color: rgba(30, 30, 30, 150);
-                border: 2px solid rgba(255, 0, 0, 150);
-                border-radius: 5px;
-                color: white;
-                font: bold 20px;
-            """)
+            if not self.missing:
+                self.missing = True
+                self.setStyleSheet(self.MISSING_STYLE)
         self.setFixedSize(self.current_size, self.current_size)
         self.setAlignment(Qt.AlignCenter) # Ensure alignment is set in both cases
 
@@ -477,10 +3327,139 @@ class DebuffIcon(QLabel):
         """Sets the opacity of the icon."""
         self.opacity_effect.setOpacity(level)
 
-# --- CategoryWindow Class (Modified setup_ui) ---
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.pending_traces:
+            painted = time.monotonic()
+            traces, self.pending_traces = self.pending_traces, []
+            for trace in traces:
+                trace['painted'] = painted
+            self.window().finish_traces(traces)
+
+class IconStrip(QWidget):
+    """Draws all of a category's icons in one paintEvent (renderer 'strip').
+
+    The alternative to a DebuffIcon per debuff: no stylesheets and no
+    QGraphicsOpacityEffect, which renders its icon offscreen on every repaint.
+    Icons come from icon_pixmaps and are drawn with their own opacity, and a
+    state change only repaints the icon rects it touched (an opacity change
+    one icon, an icon shown or hidden the icons after it).
+    """
+    SPACING = 5 # Same as the category window's debuff_layout
+
+    def __init__(self, icon_size=48, horizontal=False):
+        super().__init__()
+        self.icon_size = icon_size
+        self.horizontal = horizontal
+        self.icons = [] # [debuff data, opacity] in display order
+        self.pending_traces = [] # Latency traces finished by the next paint
+        self.resize_to_contents()
+
+    def names(self):
+        return [debuff_data['name'] for debuff_data, _ in self.icons]
+
+    def index(self, name):
+        for index, (debuff_data, _) in enumerate(self.icons):
+            if debuff_data['name'] == name:
+                return index
+        return None
+
+    def icon_rect(self, index):
+        offset = index * (self.icon_size + self.SPACING)
+        if self.horizontal:
+            return QRect(offset, 0, self.icon_size, self.icon_size)
+        return QRect(0, offset, self.icon_size, self.icon_size)
+
+    def insert(self, position, debuff_data, opacity=1.0):
+        self.icons.insert(position, [debuff_data, opacity])
+        self.resize_to_contents()
+        self.update_from(position)
+
+    def remove(self, name):
+        index = self.index(name)
+        if index is not None:
+            del self.icons[index]
+            self.update_from(index)
+            self.resize_to_contents()
+
+    def set_opacity(self, name, opacity):
+        index = self.index(name)
+        if index is not None and self.icons[index][1] != opacity:
+            self.icons[index][1] = opacity
+            self.update(self.icon_rect(index))
+
+    def set_icon_size(self, size):
+        self.icon_size = size
+        self.resize_to_contents()
+        self.update()
+
+    def set_horizontal(self, horizontal):
+        self.horizontal = horizontal
+        self.resize_to_contents()
+        self.update()
+
+    def update_from(self, index):
+        """Repaints icon index and everything after it, which moved."""
+        start = self.icon_rect(index)
+        self.update(QRect(start.topLeft(), self.rect().bottomRight()))
+
+    def resize_to_contents(self):
+        count = len(self.icons)
+        extent = count * self.icon_size + max(count - 1, 0) * self.SPACING
+        if self.horizontal:
+            self.setFixedSize(extent, self.icon_size)
+        else:
+            self.setFixedSize(self.icon_size, extent)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        dirty = event.rect()
+        for index, (debuff_data, opacity) in enumerate(self.icons):
+            rect = self.icon_rect(index)
+            if rect.intersects(dirty):
+                painter.setOpacity(opacity)
+                self.paint_icon(painter, rect, debuff_data)
+        painter.end()
+        if self.pending_traces:
+            painted = time.monotonic()
+            traces, self.pending_traces = self.pending_traces, []
+            for trace in traces:
+                trace['painted'] = painted
+            self.window().finish_traces(traces)
+
+    def paint_icon(self, painter, rect, debuff_data):
+        """Draws one icon the way DebuffIcon's stylesheets look."""
+        painter.fillRect(rect, QColor(30, 30, 30, 150))
+        pixmap = icon_pixmaps.get(debuff_data.get('icon_image', ''), self.icon_size - 2)
+        if pixmap is not None:
+            painter.drawPixmap(rect.x() + (rect.width() - pixmap.width()) // 2,
+                               rect.y() + (rect.height() - pixmap.height()) // 2, pixmap)
+            border = QColor(255, 255, 255, 100)
+        else:
+            # First letter as fallback
+            font = QFont()
+            font.setBold(True)
+            font.setPixelSize(20)
+            painter.setFont(font)
+            painter.setPen(Qt.white)
+            painter.drawText(rect, Qt.AlignCenter, debuff_data.get('name', '?')[0])
+            border = QColor(255, 0, 0, 150)
+        painter.setPen(QPen(border, 2))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(rect.adjusted(1, 1, -1, -1))
+
+# Named poll_interval_ms values; 'normal' means the category's own detection rate
+POLL_TIERS = {
+    'critical': 50,
+    'fast': 100,
+    'normal': None,
+    'passive': 1000,
+}
+
+# --- CategoryWindow Class ---
 class CategoryWindow(QWidget):
     position_changed = pyqtSignal()
-    debuff_detection_changed = pyqtSignal(str, bool)
+    detection_diff_ready = pyqtSignal() # DetectionDiffs are waiting in pending_diffs
     anchor_found_changed = pyqtSignal(bool)
     icon_size_changed = pyqtSignal(int)
 
@@ -491,12 +3470,13 @@ class CategoryWindow(QWidget):
         self.category_name = category_config['name']
         self.debuffs = debuffs # All potential debuffs for this category
         self.active_debuffs = {} # Used for default/invert modes to track visible icons
+        self.icon_pool = {} # Hidden icons of default/invert mode, reused when the debuff shows again
         self.all_debuff_icons = {} # Used for opacity mode to track all icons
+        self.pending_traces = [] # Latency traces finished by the next paint (removed icons)
+        self.pending_diffs = [] # DetectionDiffs from the engine not yet applied on the GUI thread
+        self.diff_lock = threading.Lock()
+        self.diff_counts = {'diffs': 0, 'stale_changes': 0}
 
-        self.detection_running = True
-        self.region_lock = threading.Lock()
-        self.anchor_region_lock = threading.Lock()
-        self.anchor_found = False
         self.icon_size = category_config.get('icon_size', 48) # Load icon size
         self.show_title_bar = True
 
@@ -505,27 +3485,25 @@ class CategoryWindow(QWidget):
         if not (0.0 <= self.inactive_opacity <= 1.0):
             self.inactive_opacity = 0.3
 
-        self.screen_region = QRect(
-            category_config['x'], category_config['y'],
-            category_config['width'], category_config['height']
-        )
-        self.anchor_region = QRect(
-            category_config.get('anchor_x', 0), category_config.get('anchor_y', 0),
-            category_config.get('anchor_width', 0), category_config.get('anchor_height', 0)
-        )
-
         self.layout_direction = category_config.get('layout', 'vertical')
+        self.renderer = category_config.get('renderer', 'widgets').lower() # 'widgets' or 'strip'
+        self.icon_strip = None # IconStrip drawing every icon, with renderer 'strip'
         self.anchor_detection_enabled = category_config.get('anchor_detection_enabled', False)
-        self.anchor_image_path = category_config.get('anchor_image', '')
+        self.match_mode = category_config.get('match_mode', 'standard').lower()
+
+        # Threads matching this category's templates in parallel; the category setting overrides the global one
+        match_threads = category_config.get('match_threads', debuff_tracker.global_settings.get('match_threads', 1))
+        self.engine = DetectionEngine(category_config, debuffs, debuff_tracker.capture_service,
+                                      debuff_tracker.anchor_resolver, debuff_tracker.detection_scheduler,
+                                      debuff_tracker.worker_pool, match_threads)
 
         # --- Important: Call setup_ui which initializes self.debuff_layout ---
         self.setup_ui()
         # --- End Important ---
 
         self.title_bar.set_visibility(False) # Hide title bar initially
-        self.setup_detection_thread()
 
-        self.debuff_detection_changed.connect(self.handle_debuff_update)
+        self.detection_diff_ready.connect(self.apply_pending_diffs)
         self.anchor_found_changed.connect(self.handle_anchor_found_change)
         self.icon_size_changed.connect(self.handle_icon_size_change)
 
@@ -533,12 +3511,16 @@ class CategoryWindow(QWidget):
             self.category_config.get('window_x', 100),
             self.category_config.get('window_y', 100)
         )
-        self.setVisible(not self.anchor_detection_enabled or self.anchor_found)
+        self.setVisible(not self.anchor_detection_enabled or self.engine.anchor_found)
         self.installEventFilter(self)
 
         if self.display_mode == 'opacity':
             self.initialize_opacity_mode_icons()
 
+        # Start detecting only once the signals are connected; the shared anchor resolver
+        # can otherwise emit into this window before anyone is listening.
+        self.engine.subscribe(self.queue_detection_diff, self.anchor_found_changed.emit)
+        self.engine.start()
 
     def moveEvent(self, event):
         """Update position in config when window moves"""
@@ -579,6 +3561,10 @@ class CategoryWindow(QWidget):
         # Connect toggle button
         self.title_bar.toggle_button.clicked.connect(self.toggle_layout_direction)
 
+        if self.renderer == 'strip':
+            self.icon_strip = IconStrip(self.icon_size, self.layout_direction == 'horizontal')
+            self.debuff_layout.addWidget(self.icon_strip)
+
         # Add the debuff layout to the main layout
         main_layout.addLayout(self.debuff_layout)
         main_layout.addStretch(1) # Add stretch to push icons up/left
@@ -609,13 +3595,92 @@ class CategoryWindow(QWidget):
             # Update config and save
             self.category_config.update(dialog.get_updated_config())
             self.debuff_tracker.save_settings()
-            # Update the window's category name
-            self.category_name = self.category_config['name']
-            # Recreate window to apply changes
-            self.debuff_tracker.recreate_category_window(self.category_name)
+            # Apply the changes to this window and its running detection
+            self.reconfigure(category_debuffs(self.category_config, self.debuff_tracker.debuffs))
             # Refresh tray menu
             self.debuff_tracker.setup_tray_icon()
 
+    def reconfigure(self, debuffs):
+        """Applies a changed category_config and debuff list without recreating the window.
+
+        Detection keeps running (see DetectionEngine.reconfigure). Icons of
+        deselected debuffs are removed and newly selected ones appear once they
+        have been matched; all icons are only rebuilt when the display mode or
+        renderer changed, or the selection changed in Opacity mode.
+        """
+        config = self.category_config
+        removed = {d['name'] for d in self.debuffs} - {d['name'] for d in debuffs}
+        selection_changed = [d['name'] for d in self.debuffs] != [d['name'] for d in debuffs]
+        self.debuffs = debuffs
+        self.category_name = config['name']
+        self.title_bar.title_label.setText(self.category_name)
+        self.match_mode = config.get('match_mode', 'standard').lower()
+        self.anchor_detection_enabled = config.get('anchor_detection_enabled', False)
+        match_threads = config.get('match_threads', self.debuff_tracker.global_settings.get('match_threads', 1))
+        self.engine.reconfigure(debuffs, match_threads)
+
+        display_mode = config.get('display_mode', 'default').lower()
+        renderer = config.get('renderer', 'widgets').lower()
+        if (display_mode, renderer) != (self.display_mode, self.renderer) or (
+                display_mode == 'opacity' and selection_changed):
+            self.display_mode = display_mode
+            self.renderer = renderer
+            self.rebuild_icons()
+        else:
+            for name in removed:
+                if self.icon_strip is not None:
+                    self.icon_strip.remove(name)
+                else:
+                    self.remove_debuff_icon(name, adjust=False)
+                    pooled = self.icon_pool.pop(name, None)
+                    if pooled is not None:
+                        pooled.deleteLater()
+            self.adjust_window_size()
+        self.setVisible(not self.anchor_detection_enabled or self.engine.anchor_found)
+        print(f"[{self.category_name}] Reconfigured")
+
+    def refresh_icons(self, names):
+        """Redraws the icons of these debuffs from their current definition and image file."""
+        debuff_dict = {d['name']: d for d in self.debuffs}
+        for name in names:
+            debuff_data = debuff_dict.get(name)
+            if debuff_data is None:
+                continue
+            if self.icon_strip is not None:
+                index = self.icon_strip.index(name)
+                if index is not None:
+                    self.icon_strip.icons[index][0] = debuff_data
+                    self.icon_strip.update(self.icon_strip.icon_rect(index))
+                continue
+            for icons in (self.active_debuffs, self.all_debuff_icons, self.icon_pool):
+                icon = icons.get(name)
+                if icon is not None:
+                    icon.debuff_data = debuff_data
+                    icon.update_icon()
+
+    def rebuild_icons(self):
+        """Replaces every icon for the current display mode and renderer, showing the last detected states."""
+        while self.debuff_layout.count():
+            widget = self.debuff_layout.takeAt(0).widget()
+            if widget is not None:
+                self.pending_traces.extend(widget.pending_traces) # Painted with the window instead
+                widget.hide()
+                widget.deleteLater()
+        for icon in self.icon_pool.values():
+            icon.deleteLater()
+        self.active_debuffs.clear()
+        self.all_debuff_icons.clear()
+        self.icon_pool.clear()
+        self.icon_strip = None
+        if self.renderer == 'strip':
+            self.icon_strip = IconStrip(self.icon_size, self.layout_direction == 'horizontal')
+            self.debuff_layout.addWidget(self.icon_strip)
+        if self.display_mode == 'opacity':
+            self.initialize_opacity_mode_icons()
+        self.apply_changes([(name, detected, None) for name, detected in list(self.engine.last_detection_state.items())])
+        self.adjust_window_size()
+        self.update() # Finishes the moved traces
+
     def initialize_opacity_mode_icons(self):
         """Creates and adds all icons for opacity mode."""
         print(f"[{self.category_name}] Initializing icons for Opacity mode.")
@@ -629,6 +3694,9 @@ class CategoryWindow(QWidget):
         for debuff_data in sorted_debuffs:
             if not debuff_data.get('enabled', True):
                 continue
+            if self.icon_strip is not None:
+                self.icon_strip.insert(len(self.icon_strip.icons), debuff_data, self.inactive_opacity)
+                continue
             name = debuff_data['name']
             icon = DebuffIcon(debuff_data, self.icon_size)
             icon.set_opacity(self.inactive_opacity) # Start inactive
@@ -659,6 +3727,8 @@ class CategoryWindow(QWidget):
             self.debuff_layout.setAlignment(Qt.AlignTop | Qt.AlignLeft)
             self.layout_direction = 'vertical'
             self.title_bar.toggle_button.setText("↔")
+        if self.icon_strip is not None:
+            self.icon_strip.set_horizontal(self.layout_direction == 'horizontal')
 
         # Re-add widgets (order might be based on original add order or priority)
         # For simplicity, re-adding based on the stored list might suffice,
@@ -675,6 +3745,8 @@ class CategoryWindow(QWidget):
     def handle_slider_change(self, new_size):
         """ Handles slider value change """
         if not hasattr(self, 'debuff_layout'): return # Safety check
+        # A drag passes through many sizes; drop this category's pixmaps at the old one in one go
+        icon_pixmaps.discard([d.get('icon_image', '') for d in self.debuffs], self.icon_size - 2)
         self.icon_size = new_size
         self.icon_size_changed.emit(new_size) # Emit the signal for windows to update icons
         # Save size change via position_changed signal
@@ -683,6 +3755,10 @@ class CategoryWindow(QWidget):
     def handle_icon_size_change(self, new_size):
         """Resizes all relevant icons when icon_size_changed signal is received."""
         if not hasattr(self, 'debuff_layout'): return # Safety check
+        if self.icon_strip is not None:
+            self.icon_strip.set_icon_size(new_size)
+            self.adjust_window_size()
+            return
         # Resize icons based on mode
         if self.display_mode == 'opacity':
             icon_dict = self.all_debuff_icons
@@ -694,201 +3770,61 @@ class CategoryWindow(QWidget):
         self.adjust_window_size() # Adjust window size after resizing icons
 
 
-    def setup_detection_thread(self):
-        """Sets up and starts the detection thread."""
-        self.detection_thread = threading.Thread(target=self.detection_loop)
-        self.detection_thread.daemon = True
-        self.detection_thread.start()
-
-    def detection_loop(self):
-        """The main loop for detecting debuffs on screen."""
-        last_detection_state = {} # Track last known state to only emit changes
-
-        while self.detection_running:
-            anchor_check_passed = False # Assume fail initially
-            try:
-                # --- Anchor Detection ---
-                if self.anchor_detection_enabled and self.anchor_image_path:
-                    with self.anchor_region_lock:
-                        # Make a copy to avoid holding lock during image processing
-                        anchor_region = QRect(self.anchor_region)
-
-                    if not anchor_region.isEmpty():
-                        anchor_bbox = (
-                            anchor_region.x(), anchor_region.y(),
-                            anchor_region.x() + anchor_region.width(), anchor_region.y() + anchor_region.height()
-                        )
-                        # --- Use try-except for ImageGrab ---
-                        try:
-                            anchor_screen = ImageGrab.grab(bbox=anchor_bbox)
-                            anchor_screen_np = np.array(anchor_screen)
-                            if anchor_screen_np.size == 0:
-                                print(f"Warning [{self.category_name}]: Anchor ImageGrab failed (empty).")
-                                raise ValueError("Empty anchor screenshot") # Treat as error
-
-                            anchor_gray_screen = cv2.cvtColor(anchor_screen_np, cv2.COLOR_BGR2GRAY)
-                            anchor_template_path = f"images/{self.anchor_image_path}"
-                            # --- Cache anchor template? For now, load each time ---
-                            anchor_template = cv2.imread(anchor_template_path, 0)
-
-                            if anchor_template is not None:
-                                # Check template size vs region size
-                                if anchor_template.shape[0] > anchor_gray_screen.shape[0] or \
-                                   anchor_template.shape[1] > anchor_gray_screen.shape[1]:
-                                     print(f"Warning [{self.category_name}]: Anchor template larger than anchor region.")
-                                     current_anchor_found = False
-                                else:
-                                     anchor_res = cv2.matchTemplate(anchor_gray_screen, anchor_template, cv2.TM_CCOEFF_NORMED)
-                                     _, anchor_max_val, _, _ = cv2.minMaxLoc(anchor_res)
-                                     current_anchor_found = anchor_max_val > 0.8 # Configurable threshold?
-
-                                if current_anchor_found != self.anchor_found:
-                                    self.anchor_found = current_anchor_found
-                                    self.anchor_found_changed.emit(self.anchor_found) # Emit change
-
-                                anchor_check_passed = self.anchor_found # Set based on current status
-
-                            else: # Template file not found
-                                print(f"Warning [{self.category_name}]: Anchor template not found at {anchor_template_path}")
-                                if self.anchor_found: # If previously found, now it's lost
-                                     self.anchor_found = False
-                                     self.anchor_found_changed.emit(False)
-                                anchor_check_passed = False
-
-                        except Exception as e:
-                            print(f"Anchor Detection error [{self.category_name}]: {str(e)}")
-                            if self.anchor_found: # If error, assume lost
-                                 self.anchor_found = False
-                                 self.anchor_found_changed.emit(False)
-                            anchor_check_passed = False
-                    else: # Anchor region is empty
-                         if self.anchor_found: # If previously found, now it's lost
-                              self.anchor_found = False
-                              self.anchor_found_changed.emit(False)
-                         anchor_check_passed = False
-                else:
-                    # Anchor detection not enabled, always pass this check
-                    anchor_check_passed = True
-                # --- End Anchor Detection ---
-
-
-                # --- Debuff Detection ---
-                if anchor_check_passed:
-                    with self.region_lock:
-                        # Make a copy to avoid holding lock
-                        current_region = QRect(self.screen_region)
-
-                    if current_region.isEmpty():
-                        # print(f"[{self.category_name}] Search region is empty, skipping detection.") # Optional info
-                        time.sleep(0.5) # Wait if region is not set
-                        continue
-
-                    bbox = (
-                        current_region.x(), current_region.y(),
-                        current_region.x() + current_region.width(), current_region.y() + current_region.height()
-                    )
-                    # --- Use try-except for ImageGrab ---
-                    try:
-                        screen = ImageGrab.grab(bbox=bbox)
-                        screen_np = np.array(screen)
-                        if screen_np.size == 0:
-                            print(f"Warning [{self.category_name}]: Debuff ImageGrab failed (empty).")
-                            raise ValueError("Empty debuff screenshot") # Treat as error
-
-                        gray_screen = cv2.cvtColor(screen_np, cv2.COLOR_BGR2GRAY)
-
-                    except Exception as grab_error:
-                         print(f"Debuff ImageGrab Error [{self.category_name}]: {grab_error}")
-                         # If screen grab fails, assume all debuffs are not detected for this cycle
-                         for debuff_name in list(last_detection_state.keys()): # Iterate over keys copy
-                             if last_detection_state.get(debuff_name) is True:
-                                  self.debuff_detection_changed.emit(debuff_name, False)
-                                  last_detection_state[debuff_name] = False
-                         time.sleep(0.5) # Wait a bit before retrying grab
-                         continue # Skip rest of detection loop for this cycle
-
-
-                    current_cycle_detected = set() # Track debuffs detected in this specific cycle
-
-                    for debuff in self.debuffs:
-                        if not debuff.get('enabled', True):
-                            continue
-
-                        debuff_name = debuff['name']
-                        try:
-                            template_path = f"images/{debuff['detect_image']}"
-                            # --- Cache templates? Load each time for now ---
-                            template = cv2.imread(template_path, 0)
-                            if template is None:
-                                # Only print warning once? Or use logging level
-                                # print(f"Warning [{self.category_name}]: Template not found for {debuff_name} at {template_path}")
-                                continue # Skip if template missing
-
-                            # Check if template is smaller than screen region
-                            if template.shape[0] > gray_screen.shape[0] or template.shape[1] > gray_screen.shape[1]:
-                                # print(f"Warning [{self.category_name}]: Template for {debuff_name} is larger than the search region.")
-                                continue # Skip if template too large
-
-                            res = cv2.matchTemplate(gray_screen, template, cv2.TM_CCOEFF_NORMED)
-                            _, max_val, _, _ = cv2.minMaxLoc(res)
-
-                            detected = max_val >= 0.8 # Configurable threshold?
-
-                            if detected:
-                                current_cycle_detected.add(debuff_name) # Add to set for this cycle
-
-                            # Emit signal only if state changed from last known state
-                            if last_detection_state.get(debuff_name) != detected:
-                                self.debuff_detection_changed.emit(debuff_name, detected)
-                                last_detection_state[debuff_name] = detected # Update last known state
-
-                        except cv2.error as cv2_err:
-                             # Handle specific OpenCV errors, e.g., template larger than image after grab
-                             print(f"OpenCV Error during detection [{self.category_name} - {debuff_name}]: {cv2_err}")
-                             # Assume not detected if OpenCV error occurs
-                             if last_detection_state.get(debuff_name) is not False:
-                                 self.debuff_detection_changed.emit(debuff_name, False)
-                                 last_detection_state[debuff_name] = False
-                        except Exception as e:
-                            print(f"Detection error [{self.category_name} - {debuff_name}]: {str(e)}")
-                            # If other error occurs, assume not detected and emit if state changed
-                            if last_detection_state.get(debuff_name) is not False:
-                                self.debuff_detection_changed.emit(debuff_name, False)
-                                last_detection_state[debuff_name] = False
-
-
-                    # Check for debuffs that were previously detected but not in this cycle
-                    # These need to be explicitly marked as False if they weren't already
-                    disappeared_debuffs = set(last_detection_state.keys()) - current_cycle_detected
-                    for name in disappeared_debuffs:
-                         if last_detection_state.get(name) is True: # Check if it was *actually* True before
-                              self.debuff_detection_changed.emit(name, False)
-                              last_detection_state[name] = False
-
-                else: # Anchor check failed
-                    # If anchor check failed, treat all *currently tracked* debuffs as 'not detected'
-                    # Iterate over a copy of keys as the dictionary might change
-                    for debuff_name in list(last_detection_state.keys()):
-                         if last_detection_state.get(debuff_name) is True: # If it was detected
-                              self.debuff_detection_changed.emit(debuff_name, False) # Emit not detected
-                              last_detection_state[debuff_name] = False # Update state
-
-
-                # --- Sleep ---
-                # Adjust sleep time based on needs. Shorter means more CPU usage.
-                time.sleep(0.25) # Increased slightly from 0.2
-
-            except Exception as e:
-                # Catch errors in the main loop structure itself
-                print(f"Outer Detection loop error [{self.category_name}]: {str(e)}")
-                # Avoid busy-waiting on continuous errors
-                time.sleep(1) # Wait longer after a major loop error
+    def queue_detection_diff(self, diff):
+        """Engine subscriber: queues a DetectionDiff for the GUI thread.
+
+        Only the first diff queued since the GUI thread last caught up emits the
+        signal; later ones wait in the same batch.
+        """
+        with self.diff_lock:
+            self.pending_diffs.append(diff)
+            wake = len(self.pending_diffs) == 1
+        if wake:
+            self.detection_diff_ready.emit()
+
+    def apply_pending_diffs(self):
+        """Applies every queued diff as one batch. Older changes to the same debuff are dropped."""
+        with self.diff_lock:
+            diffs, self.pending_diffs = self.pending_diffs, []
+        latest = {} # name -> (detected, trace) of its newest change
+        stale = []
+        for diff in sorted(diffs, key=lambda d: d.seq):
+            for (name, detected), trace in zip(diff.changes, diff.traces):
+                if name in latest:
+                    stale.append(latest[name][1])
+                latest[name] = (detected, trace)
+        self.diff_counts['diffs'] += len(diffs)
+        self.diff_counts['stale_changes'] += len(stale)
+        self.finish_traces([trace for trace in stale if trace is not None]) # Never shown
+        self.apply_changes([(name, detected, trace) for name, (detected, trace) in latest.items()])
+
+    def handle_debuff_update(self, name, detected, trace=None):
+        """Handles one change on its own (see apply_changes)."""
+        self.apply_changes([(name, detected, trace)])
+
+    def apply_changes(self, changes):
+        """Applies [(name, detected, trace)] for the display mode, then resizes the window once."""
+        if not hasattr(self, 'debuff_layout'): return # Safety check
+        handled = time.monotonic()
+        resized = False
+        for name, detected, trace in changes:
+            if trace is not None:
+                trace['handled'] = handled
+            # print(f"[{self.category_name}] Update for {name}: Detected={detected}, Mode={self.display_mode}") # Debug
+            resized |= self.apply_change(name, detected)
+        if resized:
+            self.adjust_window_size()
 
+        updated = time.monotonic()
+        for name, _, trace in changes:
+            if trace is not None:
+                trace['updated'] = updated
+                self.track_paint(name, trace)
 
-    def handle_debuff_update(self, name, detected):
-        """Handles updates based on detection state and display mode."""
-        # print(f"[{self.category_name}] Update for {name}: Detected={detected}, Mode={self.display_mode}") # Debug
-        if not hasattr(self, 'debuff_layout'): return # Safety check
+    def apply_change(self, name, detected):
+        """Shows, hides or fades name's icon. Returns True if icons were added or removed."""
+        if self.icon_strip is not None:
+            return self.update_strip(name, detected)
 
         if self.display_mode == 'opacity':
             if name in self.all_debuff_icons:
@@ -896,65 +3832,116 @@ class CategoryWindow(QWidget):
                 self.all_debuff_icons[name].set_opacity(opacity)
             # else: # Icon should always exist in opacity mode if initialized correctly
             #      print(f"Warning: Icon for {name} not found in all_debuff_icons for opacity mode.")
+            return False
 
         elif self.display_mode == 'invert':
             # Show when detected, hide when not detected
             if detected:
-                self.add_debuff_icon(name)
-            else:
-                self.remove_debuff_icon(name)
+                return self.add_debuff_icon(name, adjust=False)
+            return self.remove_debuff_icon(name, adjust=False)
 
         else: # Default mode
             # Show when NOT detected, hide when detected
             if not detected:
-                self.add_debuff_icon(name)
-            else:
-                self.remove_debuff_icon(name)
+                return self.add_debuff_icon(name, adjust=False)
+            return self.remove_debuff_icon(name, adjust=False)
 
-    def add_debuff_icon(self, name):
-        """Adds a debuff icon to the layout in the order specified by selected_debuffs."""
-        if not hasattr(self, 'debuff_layout') or name in self.active_debuffs:
+    def update_strip(self, name, detected):
+        """apply_change for renderer 'strip'."""
+        if self.display_mode == 'opacity':
+            self.icon_strip.set_opacity(name, 1.0 if detected else self.inactive_opacity)
+            return False
+        shown = self.icon_strip.names()
+        visible = detected if self.display_mode == 'invert' else not detected
+        if visible and name not in shown:
+            debuff_data = next((d for d in self.debuffs if d['name'] == name), None)
+            if debuff_data:
+                self.icon_strip.insert(self.insert_position(name, shown), debuff_data)
+                return True
+        elif not visible and name in shown:
+            self.icon_strip.remove(name)
+            return True
+        return False
+
+    def track_paint(self, name, trace):
+        """Finishes trace on the next paint of the changed icon, or of the window if the icon is gone."""
+        if not self.isVisible():
+            self.finish_traces([trace]) # Nothing will be painted
             return
+        if self.icon_strip is not None:
+            target = self.icon_strip if self.icon_strip.index(name) is not None else self
+        else:
+            target = self.active_debuffs.get(name) or self.all_debuff_icons.get(name) or self
+        target.pending_traces.append(trace)
+        target.update()
+
+    def finish_traces(self, traces):
+        """Hands painted (or unpaintable) traces to the tracker's LatencyTracer."""
+        for trace in traces:
+            if 'painted' in trace:
+                self.engine.metrics.record('paint_delay_ms', (trace['painted'] - trace['emitted']) * 1000.0)
+            self.debuff_tracker.latency_tracer.finish(trace)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.pending_traces:
+            painted = time.monotonic()
+            traces, self.pending_traces = self.pending_traces, []
+            for trace in traces:
+                trace['painted'] = painted
+            self.finish_traces(traces)
+
+    def add_debuff_icon(self, name, adjust=True):
+        """Adds a debuff icon to the layout in the order specified by selected_debuffs.
+
+        Returns True if it was added. With adjust False the caller resizes the window.
+        """
+        if not hasattr(self, 'debuff_layout') or name in self.active_debuffs:
+            return False
 
         debuff_data = next((d for d in self.debuffs if d['name'] == name), None)
         if not debuff_data:
-            return
+            return False
 
-        # Create the icon
-        icon = DebuffIcon(debuff_data, self.icon_size)
+        # Reuse the icon from the last time this debuff was shown
+        icon = self.icon_pool.pop(name, None)
+        if icon is None:
+            icon = DebuffIcon(debuff_data, self.icon_size)
+        elif icon.current_size != self.icon_size:
+            icon.resize_icon(self.icon_size) # The slider moved while it was hidden
+        # Insert at the position from selected_debuffs
+        self.debuff_layout.insertWidget(self.insert_position(name, self.active_debuffs), icon)
         self.active_debuffs[name] = icon
 
-        # Get the position from selected_debuffs
-        try:
-            # Get the full list of selected debuff names
-            selected_order = self.category_config.get('selected_debuffs', [])
-            target_index = selected_order.index(name)
-            
-            # Count how many preceding debuffs are currently active
-            insert_position = 0
-            for preceding_name in selected_order[:target_index]:
-                if preceding_name in self.active_debuffs:
-                    insert_position += 1
-
-            # Insert at the calculated position
-            self.debuff_layout.insertWidget(insert_position, icon)
-        except ValueError:
-            # If not found in selected_debuffs, append to end (shouldn't happen normally)
-            self.debuff_layout.addWidget(icon)
-
         icon.show()
-        self.adjust_window_size()
-
-    def remove_debuff_icon(self, name):
-        """Removes a debuff icon from the layout (for default/invert modes)."""
-        if not hasattr(self, 'debuff_layout'): return # Safety check
+        if adjust:
+            self.adjust_window_size()
+        return True
+
+    def insert_position(self, name, shown):
+        """Index for name among the shown icons, in selected_debuffs order."""
+        selected_order = self.category_config.get('selected_debuffs', [])
+        if name not in selected_order:
+            return len(shown) # Append to end (shouldn't happen normally)
+        # Count how many preceding debuffs are currently shown
+        return sum(1 for preceding_name in selected_order[:selected_order.index(name)] if preceding_name in shown)
+
+    def remove_debuff_icon(self, name, adjust=True):
+        """Removes a debuff icon from the layout (for default/invert modes). Returns True if it was shown."""
+        if not hasattr(self, 'debuff_layout'): return False # Safety check
         if name in self.active_debuffs:
             # print(f"[{self.category_name}] Removing icon: {name}") # Debug
             widget = self.active_debuffs.pop(name)
-            # Remove from layout explicitly before deleting
+            # Remove from layout, but keep the widget for when the debuff shows again
             self.debuff_layout.removeWidget(widget)
-            widget.deleteLater() # Schedule for deletion
-            self.adjust_window_size()
+            widget.hide()
+            self.pending_traces.extend(widget.pending_traces) # A hidden icon won't paint them
+            widget.pending_traces = []
+            self.icon_pool[name] = widget
+            if adjust:
+                self.adjust_window_size()
+            return True
+        return False
 
 
     def adjust_window_size(self):
@@ -964,7 +3951,10 @@ class CategoryWindow(QWidget):
         if not hasattr(self, 'debuff_layout') or not self.debuff_layout: return
 
         title_height = self.title_bar.height() if self.title_bar.is_visible else 0
-        icon_count = self.debuff_layout.count() # Count widgets currently in layout
+        if self.icon_strip is not None:
+            icon_count = len(self.icon_strip.icons)
+        else:
+            icon_count = self.debuff_layout.count() # Count widgets currently in layout
 
         spacing = self.debuff_layout.spacing()
         margins = self.debuff_layout.contentsMargins()
@@ -1005,14 +3995,12 @@ class CategoryWindow(QWidget):
 
     def update_region(self, new_region):
         """Updates the screen region to monitor."""
-        with self.region_lock:
-            self.screen_region = new_region
+        self.engine.update_region(rect_tuple(new_region))
         print(f"[{self.category_name}] Search region updated to: {new_region}")
 
     def update_anchor_region(self, new_region):
         """Updates the anchor region."""
-        with self.anchor_region_lock:
-            self.anchor_region = new_region
+        self.engine.update_anchor_region(rect_tuple(new_region))
         print(f"[{self.category_name}] Anchor region updated to: {new_region}")
 
     def handle_anchor_found_change(self, found):
@@ -1023,15 +4011,9 @@ class CategoryWindow(QWidget):
         # print(f"[{self.category_name}] Anchor found: {found}. Window visible: {self.isVisible()}")
 
     def closeEvent(self, event):
-        """Stops the detection thread on close."""
+        """Stops detection for this category on close."""
         print(f"Closing category window: {self.category_name}")
-        self.detection_running = False # Signal thread to stop
-        # Wait for thread to finish before proceeding
-        if hasattr(self, 'detection_thread') and self.detection_thread.is_alive():
-            print(f"Waiting for detection thread in {self.category_name} to finish...")
-            self.detection_thread.join(timeout=1.5) # Increased timeout slightly
-            if self.detection_thread.is_alive():
-                 print(f"Warning: Detection thread in {self.category_name} did not exit cleanly.")
+        self.engine.stop() # Waits at most for one tick in progress, no thread to join
         super().closeEvent(event) # Call parent closeEvent
 
     def eventFilter(self, obj, event):
@@ -1053,7 +4035,149 @@ class CategoryWindow(QWidget):
                     self.adjust_window_size() # Recalculate size without title bar
         return super().eventFilter(obj, event)
 
-# --- DebuffTracker Class (Mostly Unchanged, minor logging/init order) ---
+# --- Settings Store ---
+class SettingsStore:
+    """Writes settings.json behind the GUI thread, atomically.
+
+    DebuffTracker marks the store dirty on every change (a title-bar drag moves
+    the window once per pixel) and submits one snapshot after a quiet period or
+    on exit. A writer thread writes the newest snapshot to a temp file and
+    renames it over the target, so a crash mid-write leaves the previous file
+    intact. A snapshot identical to the last one written is skipped.
+
+    avoided counts save requests that didn't end in a write of their own.
+    """
+    def __init__(self, path='settings.json'):
+        self.path = Path(path)
+        self.dirty = False
+        self.requests = 0
+        self.writes = 0
+        self.avoided = 0
+        self._unsubmitted = 0 # Requests since the last submit()
+        self._pending = None # Serialized snapshot waiting for the writer
+        self._writing = False
+        self._written = None # Text of the last write, to skip identical ones
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="SettingsWriter", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        with self._condition:
+            self.dirty = True
+            self.requests += 1
+            self._unsubmitted += 1
+
+    def submit(self, settings):
+        """Queues a snapshot for the writer thread, replacing one still waiting."""
+        text = json.dumps(settings, indent=2) # Serialized now; the dicts keep changing on the GUI thread
+        with self._condition:
+            if self._pending is not None:
+                self.avoided += 1 # Superseded before it was written
+            self.avoided += max(self._unsubmitted - 1, 0) # Merged into this snapshot
+            self._unsubmitted = 0
+            self.dirty = False
+            self._pending = text
+            self._condition.notify_all()
+
+    def write(self, settings):
+        """Writes settings now, on the calling thread."""
+        with self._condition:
+            self.dirty = False
+            self._unsubmitted = 0
+        self._write(json.dumps(settings, indent=2))
+
+    def flush(self, timeout=5.0):
+        """Waits until the submitted snapshot is on disk."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending is None and not self._writing, timeout)
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None or not self._running)
+                if self._pending is None:
+                    return
+                text, self._pending = self._pending, None
+                self._writing = True
+            try:
+                self._write(text)
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write(self, text):
+        with self._write_lock:
+            if text == self._written:
+                with self._condition:
+                    self.avoided += 1
+                return
+            temp_path = self.path.with_name(self.path.name + '.tmp')
+            try:
+                with open(temp_path, 'w') as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self._written = text
+                self.writes += 1
+            except Exception as e:
+                print(f"Error saving settings to {self.path}: {str(e)}")
+
+    def stats(self):
+        with self._condition:
+            return {'requests': self.requests, 'writes': self.writes, 'avoided': self.avoided,
+                    'pending': self.dirty or self._pending is not None}
+
+# Top-level settings.json options and their defaults
+GLOBAL_SETTING_DEFAULTS = {
+    'capture_backend': 'pil', # One of CAPTURE_BACKENDS: 'auto', 'mss', 'pil', 'file' or 'replay'
+    'anchor_poll_hz': 1.0, # Tick rate of categories whose anchor is not on screen
+    'execution_mode': 'thread', # 'thread' or 'process' (matching in DetectionWorkerPool processes)
+    'detection_workers': 0, # Worker processes in process mode, 0 = one per category up to the core count
+    'match_threads': 1, # Threads matching one category's templates in parallel (categories may override)
+    'cpu_budget_percent': 0.0, # Slow detection down to stay under this share of one core (0 = no cap)
+    'cpu_min_rate_scale': 0.25, # Never slow it below this fraction of the configured rates
+    'metrics_port': 0, # Serve performance metrics on http://127.0.0.1:<port>/metrics (0 = off)
+    'metrics_file': '', # Also write them as JSON to this file every metrics_interval_s ('' = off)
+    'metrics_interval_s': 5.0,
+    'trace_file': '', # Append grab-to-paint latency traces in Chrome trace format to this file ('' = off)
+    'profile_seconds': 30.0, # Length of a Profile CPU run from the tray menu
+    'profile_interval_ms': 5.0, # Time between stack samples while profiling
+    'settings_save_delay_s': 1.0, # Write settings.json once changes have stopped for this long
+    'watch_assets': True, # Apply edits to debuffs.json and images/ while running
+    'asset_reload_delay_s': 0.5, # Reload once the files have stopped changing for this long
+}
+
+def file_signature(path):
+    """(mtime_ns, size) of path, or None if it doesn't exist."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def category_debuffs(category_config, debuffs):
+    """The debuff definitions a category watches, in its selected_debuffs order."""
+    debuff_dict = {d['name']: d for d in debuffs}
+    selected = []
+    for name in category_config.get('selected_debuffs', []):
+        if name in debuff_dict:
+            selected.append(debuff_dict[name])
+        else:
+            print(f"Warning: Debuff '{name}' not found for category '{category_config.get('name', 'Unnamed Category')}'")
+    return selected
+
+# --- DebuffTracker Class ---
 class DebuffTracker(QWidget):
     def __init__(self):
         super().__init__()
@@ -1063,14 +4187,55 @@ class DebuffTracker(QWidget):
         self.active_selector = None
         self.anchor_selector = None
         self.debuffs = [] # Initialize debuffs list
+        self.global_settings = dict(GLOBAL_SETTING_DEFAULTS) # Top-level settings.json keys other than 'categories'
+        self.settings_store = SettingsStore('settings.json')
 
         # --- Load settings and debuffs before creating UI ---
         self.load_settings()
+        # Saves wait for the window drag or slider move to end
+        self.settings_save_timer = QTimer(self)
+        self.settings_save_timer.setSingleShot(True)
+        self.settings_save_timer.setInterval(int(float(self.global_settings.get('settings_save_delay_s', 1.0)) * 1000))
+        self.settings_save_timer.timeout.connect(self.write_settings)
         self.load_debuffs()
         # --- End Load ---
 
+        # One screen grab per tick shared by all categories
+        self.capture_service = CaptureService(create_capture_backend(self.global_settings))
+        print(f"Capture backend: {self.capture_service.backend.name}")
+        self.anchor_resolver = AnchorResolver(template_bank) # One anchor match per unique anchor per frame
+        self.latency_tracer = LatencyTracer(self.global_settings.get('trace_file', ''))
+        self.profiler = SamplingProfiler() # Only samples while started from the tray
+        self.cpu_governor = CpuGovernor(self.global_settings.get('cpu_budget_percent', 0.0),
+                                        self.global_settings.get('cpu_min_rate_scale', 0.25))
+        self.worker_pool = self.create_worker_pool()
+        # One thread runs every category's ticks on fixed deadlines
+        self.detection_scheduler = DetectionScheduler(self.capture_service,
+                                                      self.global_settings.get('anchor_poll_hz', 1.0),
+                                                      governor=self.cpu_governor)
+
         self.setup_tray_icon()
         self.create_category_windows() # Create windows after loading data
+        self.setup_metrics_export()
+        self.setup_asset_watcher()
+
+    def create_worker_pool(self):
+        """Starts the detection worker processes if execution_mode is 'process', else returns None."""
+        mode = str(self.global_settings.get('execution_mode', 'thread')).lower()
+        if mode != 'process':
+            if mode != 'thread':
+                print(f"Warning: Unknown execution_mode '{mode}', using threads.")
+            return None
+        workers = int(self.global_settings.get('detection_workers', 0) or 0)
+        if workers <= 0:
+            workers = min(max(len(self.categories), 1), max((os.cpu_count() or 2) - 1, 1))
+        try:
+            pool = DetectionWorkerPool(workers, self.cpu_governor)
+        except Exception as e:
+            print(f"Could not start detection workers ({e}), using threads.")
+            return None
+        print(f"Detection workers: {pool.worker_count}")
+        return pool
 
     def load_settings(self):
         """Loads category settings from settings.json."""
@@ -1079,8 +4244,7 @@ class DebuffTracker(QWidget):
         try:
             if not settings_path.exists():
                  print(f"{settings_path} not found, creating default.")
-                 with open(settings_path, 'w') as f:
-                      json.dump(default_settings, f, indent=2)
+                 self.settings_store.write(default_settings)
                  settings = default_settings
             else:
                  with open(settings_path) as f:
@@ -1099,27 +4263,46 @@ class DebuffTracker(QWidget):
 
         self.categories = settings.get('categories', [])
         needs_save = False
-        # Ensure all required fields exist, including new ones
+        # Global options live next to 'categories'
+        for key, default in GLOBAL_SETTING_DEFAULTS.items():
+            if key not in settings:
+                settings[key] = default
+                needs_save = True
+        self.global_settings = {k: v for k, v in settings.items() if k != 'categories'}
         for i, cat in enumerate(self.categories):
-            # Using setdefault returns the value, check if it was the default to see if save needed
-            if cat.setdefault('name', f'Category_{i+1}') == f'Category_{i+1}' and 'name' not in cat: needs_save = True
-            if cat.setdefault('x', 0) == 0 and 'x' not in cat: needs_save = True
-            if cat.setdefault('y', 0) == 0 and 'y' not in cat: needs_save = True
-            if cat.setdefault('width', 100) == 100 and 'width' not in cat: needs_save = True
-            if cat.setdefault('height', 100) == 100 and 'height' not in cat: needs_save = True
-            if cat.setdefault('window_x', 100 + i*50) == 100 + i*50 and 'window_x' not in cat: needs_save = True
-            if cat.setdefault('window_y', 100 + i*50) == 100 + i*50 and 'window_y' not in cat: needs_save = True
-            if cat.setdefault('anchor_detection_enabled', False) is False and 'anchor_detection_enabled' not in cat: needs_save = True
-            if cat.setdefault('anchor_image', '') == '' and 'anchor_image' not in cat: needs_save = True # Allow empty string
-            if cat.setdefault('anchor_x', 0) == 0 and 'anchor_x' not in cat: needs_save = True
-            if cat.setdefault('anchor_y', 0) == 0 and 'anchor_y' not in cat: needs_save = True
-            if cat.setdefault('anchor_width', 0) == 0 and 'anchor_width' not in cat: needs_save = True
-            if cat.setdefault('anchor_height', 0) == 0 and 'anchor_height' not in cat: needs_save = True
-            if cat.setdefault('icon_size', 48) == 48 and 'icon_size' not in cat: needs_save = True
-            if cat.setdefault('layout', 'vertical') == 'vertical' and 'layout' not in cat: needs_save = True
-            # --- New Fields ---
-            if cat.setdefault('display_mode', 'default') == 'default' and 'display_mode' not in cat: needs_save = True
-            if cat.setdefault('inactive_opacity', 0.3) == 0.3 and 'inactive_opacity' not in cat: needs_save = True
+            # Ensure all required fields exist, including new ones (window position staggers per category)
+            category_defaults = {
+                'name': f'Category_{i+1}',
+                'x': 0,
+                'y': 0,
+                'width': 100,
+                'height': 100,
+                'window_x': 100 + i*50,
+                'window_y': 100 + i*50,
+                'anchor_detection_enabled': False,
+                'anchor_image': '',
+                'anchor_x': 0,
+                'anchor_y': 0,
+                'anchor_width': 0,
+                'anchor_height': 0,
+                'icon_size': 48,
+                'layout': 'vertical',
+                'display_mode': 'default',
+                'inactive_opacity': 0.3,
+                'match_mode': 'standard',
+                'renderer': 'widgets',
+                'detection_rate_hz': 4.0,
+                'threshold': 0.8,
+                'slot_pitch': 0,
+                'slot_offset': 0,
+                'slot_jitter': 2,
+                'pyramid_levels': 1,
+                'pyramid_candidates': 3,
+            }
+            for key, default in category_defaults.items():
+                if key not in cat:
+                    cat[key] = default
+                    needs_save = True
             cat.setdefault('selected_debuffs', [])
             if 'debuffs' in cat:
                 del cat['debuffs']
@@ -1133,7 +4316,12 @@ class DebuffTracker(QWidget):
 
 
     def save_settings(self):
-        """Saves current category settings to settings.json. Triggered by signals."""
+        """Schedules a write of settings.json. Triggered by signals; see SettingsStore."""
+        self.settings_store.mark_dirty()
+        self.settings_save_timer.start() # Restarts the quiet period
+
+    def write_settings(self):
+        """Hands the current settings to the settings store's writer thread."""
         # Ensure all category configs are up-to-date from windows
         for window in self.category_windows:
             for cat in self.categories:
@@ -1146,38 +4334,35 @@ class DebuffTracker(QWidget):
                     # Regions are updated directly in update_category_region/anchor_region
                     break
 
-        settings_to_save = {'categories': self.categories}
-        self.save_settings_internal(settings_to_save)
+        settings_to_save = {'categories': self.categories, **self.global_settings}
+        self.settings_store.submit(settings_to_save)
 
     def save_settings_internal(self, settings_dict):
         """Internal method to write settings to file."""
-        settings_path = Path('settings.json')
-        try:
-            with open(settings_path, 'w') as f:
-                json.dump(settings_dict, f, indent=2)
-            # print("Settings saved.") # Optional confirmation
-        except Exception as e:
-            print(f"Error saving settings to {settings_path}: {str(e)}")
+        self.settings_store.write(settings_dict)
 
 
     def load_debuffs(self):
         """Loads debuff definitions from debuffs.json."""
+        self.debuffs_signature = file_signature(Path('debuffs.json')) # What reload_assets compares against
+        debuffs = self.read_debuffs()
+        self.debuffs = debuffs if debuffs is not None else []
+
+    def read_debuffs(self):
+        """Returns the valid debuff definitions in debuffs.json, or None if it can't be read."""
         debuffs_path = Path('debuffs.json')
-        default_debuffs = []
         try:
             if not debuffs_path.exists():
                 print(f"{debuffs_path} not found. No debuffs loaded.")
-                self.debuffs = default_debuffs
-                return
+                return None
 
             with open(debuffs_path) as f:
                 loaded_data = json.load(f)
                 if not isinstance(loaded_data, list):
                     print(f"Warning: {debuffs_path} should contain a list. Loading empty list.")
-                    self.debuffs = default_debuffs
-                    return
+                    return None
 
-                self.debuffs = []
+                debuffs = []
                 for i, debuff in enumerate(loaded_data):
                     if not isinstance(debuff, dict):
                         print(f"Warning: Item at index {i} in debuffs.json is not a dictionary. Skipping.")
@@ -1189,11 +4374,12 @@ class DebuffTracker(QWidget):
                         print(f"Warning: Debuff at index {i} is missing required fields. Skipping.")
                         continue
 
-                    self.debuffs.append(debuff)
+                    debuffs.append(debuff)
+                return debuffs
 
         except Exception as e:
             print(f"Error loading debuffs: {str(e)}")
-            self.debuffs = default_debuffs
+            return None
 
     def create_category_windows(self):
         """Creates the CategoryWindow instances based on settings."""
@@ -1201,23 +4387,10 @@ class DebuffTracker(QWidget):
             window.close()
         self.category_windows.clear()
 
-        # Create lookup dictionary for debuffs
-        debuff_dict = {d['name']: d for d in self.debuffs}
-
         for category_config in self.categories:
             category_name = category_config.get('name', 'Unnamed Category')
-            selected_names = category_config.get('selected_debuffs', [])
-            
-            # Get debuffs in order of selected_names
-            category_debuffs = []
-            for name in selected_names:
-                if name in debuff_dict:
-                    category_debuffs.append(debuff_dict[name])
-                else:
-                    print(f"Warning: Debuff '{name}' not found for category '{category_name}'")
-
             try:
-                window = CategoryWindow(category_config, category_debuffs, self)
+                window = CategoryWindow(category_config, category_debuffs(category_config, self.debuffs), self)
                 window.position_changed.connect(self.save_settings)
                 window.show()
                 self.category_windows.append(window)
@@ -1266,6 +4439,30 @@ class DebuffTracker(QWidget):
         new_action = QAction("New Category", self)
         new_action.triggered.connect(self.add_new_category)
         categories_menu.addAction(new_action)
+
+        reload_action = QAction("Reload Debuffs", self)
+        reload_action.triggered.connect(self.reload_assets)
+        menu.addAction(reload_action)
+
+        stats_action = QAction("Detection Stats", self)
+        stats_action.triggered.connect(self.show_detection_stats)
+        menu.addAction(stats_action)
+
+        performance_action = QAction("Performance", self)
+        performance_action.triggered.connect(self.show_performance)
+        menu.addAction(performance_action)
+
+        self.profile_action = QAction(self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.triggered.connect(self.toggle_profiler)
+        menu.addAction(self.profile_action)
+        menu.aboutToShow.connect(self.update_profile_action) # The profiler also stops on its own
+        self.update_profile_action()
+
+        record_action = QAction("Stop Recording" if self.capture_service.recorder else "Record Frames", self)
+        record_action.triggered.connect(self.toggle_recording)
+        menu.addAction(record_action)
+
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close_all)
         menu.addAction(exit_action)
@@ -1273,6 +4470,122 @@ class DebuffTracker(QWidget):
         self.tray_icon.setContextMenu(menu)
         self.tray_icon.show()
 
+    def performance_snapshot(self):
+        """Capture stats and every category's rolling metrics. Safe to call from any thread."""
+        categories = {}
+        for window in list(self.category_windows):
+            metrics = window.engine.performance()
+            schedule = self.detection_scheduler.stats(window.engine)
+            if schedule is not None:
+                metrics['target_hz'] = schedule['target_hz']
+            categories[window.category_name] = metrics
+        return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'capture': self.capture_service.backend.stats(),
+                'cpu': self.cpu_governor.stats(), 'categories': categories, 'latency': self.latency_tracer.summary()}
+
+    def show_performance(self):
+        """Shows the rolling per-category latency metrics (last minute or so)."""
+        QMessageBox.information(None, "Performance", format_metrics(self.performance_snapshot()))
+
+    def setup_metrics_export(self):
+        """Starts the localhost metrics endpoint and the metrics file writer if configured."""
+        self.metrics_server = None
+        self.metrics_timer = None
+        port = int(self.global_settings.get('metrics_port', 0) or 0)
+        if port:
+            try:
+                self.metrics_server = MetricsServer(port, self.performance_snapshot)
+                print(f"Metrics: http://127.0.0.1:{self.metrics_server.port}/metrics")
+            except OSError as e:
+                print(f"Could not serve metrics on port {port}: {e}")
+        if self.global_settings.get('metrics_file'):
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(self.write_metrics_file)
+            self.metrics_timer.start(int(float(self.global_settings.get('metrics_interval_s', 5.0)) * 1000))
+
+    def write_metrics_file(self):
+        path = Path(self.global_settings['metrics_file'])
+        try:
+            temp_path = path.with_name(path.name + '.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump(self.performance_snapshot(), f, indent=2)
+            os.replace(temp_path, path) # Readers never see a half-written file
+        except Exception as e:
+            print(f"Error writing metrics to {path}: {e}")
+
+    def toggle_profiler(self):
+        """Starts a bounded CPU profile of every thread, or stops the running one early."""
+        if self.profiler.running:
+            self.profiler.stop()
+        else:
+            # Next to settings.json, named by start time
+            path = Path(f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            seconds = float(self.global_settings.get('profile_seconds', 30.0))
+            self.profiler.start(path, seconds, float(self.global_settings.get('profile_interval_ms', 5.0)) / 1000.0)
+            print(f"Profiling for up to {seconds:g} s into {path}")
+        self.update_profile_action()
+
+    def update_profile_action(self):
+        running = self.profiler.running
+        self.profile_action.setChecked(running)
+        self.profile_action.setText("Stop Profiling" if running else "Profile CPU")
+
+    def toggle_recording(self):
+        """Starts recording captured frames to recordings/<date-time>, or stops the running recording."""
+        recorder = self.capture_service.stop_recording()
+        if recorder is not None:
+            print(f"Recorded {recorder.frames} frames ({recorder.bytes / 1e6:.1f} MB) to {recorder.path}")
+        else:
+            path = Path('recordings') / time.strftime('%Y%m%d-%H%M%S')
+            try:
+                self.capture_service.start_recording(path)
+                print(f"Recording frames to {path}")
+            except Exception as e:
+                print(f"Could not start recording to {path}: {e}")
+        self.setup_tray_icon() # Update the menu entry
+
+    def show_detection_stats(self):
+        """Shows the shared template bank counters and capture latency."""
+        stats = template_bank.stats()
+        icons = icon_pixmaps.stats()
+        saves = self.settings_store.stats()
+        capture = self.capture_service.backend.stats()
+        text = (f"Cached templates: {stats['entries']}\n"
+                f"Hits: {stats['hits']}\n"
+                f"Misses (disk loads): {stats['misses']}\n"
+                f"Reloads (file changed): {stats['reloads']}\n"
+                f"Cached icons: {icons['entries']} (hits {icons['hits']}, misses {icons['misses']})\n"
+                f"Settings saves: {saves['requests']} requested, {saves['writes']} written, "
+                f"{saves['avoided']} avoided\n\n"
+                f"Capture backend: {capture['backend']}\n"
+                f"Grabs: {capture['grabs']}\n"
+                f"Grab latency: last {capture['last_ms']} ms, avg {capture['avg_ms']} ms, max {capture['max_ms']} ms\n"
+                f"{format_cpu(self.cpu_governor.stats())}")
+        if self.worker_pool is not None:
+            workers = self.worker_pool.stats()
+            text += (f"\n\nWorker processes: {workers['alive']}/{workers['workers']} alive, "
+                     f"{workers['restarts']} restarts\n"
+                     f"Jobs: {workers['dispatched']} sent, {workers['results']} done, "
+                     f"{workers['busy_skips']} skipped (worker busy)")
+        for window in self.category_windows:
+            counts = window.engine.detection_stats()
+            text += (f"\n\n{window.category_name}:\n"
+                     f"Frames: {counts['frames']} (unchanged {counts['skipped_frames']}, partial {counts['partial_frames']})\n"
+                     f"Matches: full {counts['full_matches']}, partial {counts['partial_matches']}, "
+                     f"skipped {counts['skipped_matches']}, not due {counts['deferred_matches']}")
+            schedule = self.detection_scheduler.stats(window.engine)
+            if schedule is not None:
+                text += (f"\nRate: {schedule['actual_hz']} / {schedule['target_hz']} Hz"
+                         f"{' (anchor polling)' if schedule['anchor_polling'] else ''}, "
+                         f"jitter avg {schedule['jitter_ms']} ms, max {schedule['max_jitter_ms']} ms, "
+                         f"dropped {schedule['dropped']}")
+            text += (f"\nDiffs applied: {window.diff_counts['diffs']}, "
+                     f"stale changes dropped: {window.diff_counts['stale_changes']}")
+            if window.match_mode == 'slots':
+                text += f"\nSlots: {counts['present_slots']}"
+        print(f"Template bank: {stats}")
+        print(f"Capture: {capture}")
+        QMessageBox.information(None, "Detection Stats", text)
+
     def open_category_settings(self, category_name):
         for window in self.category_windows:
             if window.category_name == category_name:
@@ -1299,6 +4612,9 @@ class DebuffTracker(QWidget):
             'anchor_x': 0, 'anchor_y': 0, 'anchor_width': 0, 'anchor_height': 0,
             'icon_size': 48, 'layout': 'vertical',
             'display_mode': 'default', 'inactive_opacity': 0.3,
+            'match_mode': 'standard',
+            'renderer': 'widgets',
+            'detection_rate_hz': 4.0,
             'selected_debuffs': []
         }
         self.categories.append(new_category)
@@ -1408,53 +4724,112 @@ class DebuffTracker(QWidget):
         else:
             print(f"Category {category_name} not found in settings.")
     
-    def recreate_category_window(self, category_name):
-        # Close existing window
-        for window in self.category_windows[:]:
-            if window.category_name == category_name:
-                window.close()
-                self.category_windows.remove(window)
-        
-        # Create new window
-        category_config = next((c for c in self.categories if c['name'] == category_name), None)
-        if category_config:
-            selected_names = category_config.get('selected_debuffs', [])
-            debuff_dict = {d['name']: d for d in self.debuffs}
-            category_debuffs = [debuff_dict[name] for name in selected_names if name in debuff_dict]
-            new_window = CategoryWindow(category_config, category_debuffs, self)  # Pass self as tracker
-            new_window.position_changed.connect(self.save_settings)
-            new_window.show()
-            self.category_windows.append(new_window)
-        # Refresh the tray icon to reflect changes
-        self.setup_tray_icon()
-        
-    # --- Optional Reload Functionality ---
-    # def reload_all(self):
-    #     """Reloads settings and debuffs, then recreates windows."""
-    #     print("Reloading settings and debuffs...")
-    #     # Stop detection in existing windows first
-    #     for window in self.category_windows:
-    #         window.detection_running = False
-    #         if hasattr(window, 'detection_thread') and window.detection_thread.is_alive():
-    #             window.detection_thread.join(timeout=0.5)
-    #         window.close() # Close existing windows
-    #     self.category_windows.clear()
-
-    #     # Reload data
-    #     self.load_settings()
-    #     self.load_debuffs()
-
-    #     # Recreate UI elements
-    #     self.setup_tray_icon() # Update tray menu if categories changed
-    #     self.create_category_windows() # Create new windows
-    #     print("Reload complete.")
-    # --- End Reload ---
+    # --- Live Reload ---
+    def setup_asset_watcher(self):
+        """Reloads debuffs.json and images/ in place when they change on disk (watch_assets)."""
+        self.image_signatures = self.read_image_signatures()
+        # Editors and image tools often write a file several times in a row; reload once it settles
+        self.asset_reload_timer = QTimer(self)
+        self.asset_reload_timer.setSingleShot(True)
+        self.asset_reload_timer.setInterval(int(float(self.global_settings.get('asset_reload_delay_s', 0.5)) * 1000))
+        self.asset_reload_timer.timeout.connect(self.reload_assets)
+        self.asset_watcher = None
+        if self.global_settings.get('watch_assets', True):
+            self.asset_watcher = QFileSystemWatcher(self)
+            self.asset_watcher.fileChanged.connect(self.schedule_asset_reload)
+            self.asset_watcher.directoryChanged.connect(self.schedule_asset_reload)
+            self.watch_assets()
+
+    def watch_assets(self):
+        """Watches debuffs.json, images/ (for added files) and every image in use (for edits)."""
+        paths = {'debuffs.json', str(IMAGES_DIR)}
+        for debuff in self.debuffs:
+            paths.update(str(IMAGES_DIR / debuff[key]) for key in ('detect_image', 'icon_image') if debuff[key])
+        for category in self.categories:
+            if category.get('anchor_image'):
+                paths.add(str(IMAGES_DIR / category['anchor_image']))
+        # A file replaced by an atomic save drops out of the watch, so this runs after every reload
+        watched = set(self.asset_watcher.files()) | set(self.asset_watcher.directories())
+        missing = [path for path in paths - watched if os.path.exists(path)]
+        if missing:
+            self.asset_watcher.addPaths(missing)
+
+    def schedule_asset_reload(self, path=None):
+        self.asset_reload_timer.start() # Restarts the quiet period
+
+    def read_image_signatures(self):
+        """{filename relative to images/: (mtime_ns, size)} of every file in images/."""
+        signatures = {}
+        if IMAGES_DIR.is_dir():
+            for path in IMAGES_DIR.rglob('*'):
+                signature = file_signature(path)
+                if signature is not None and path.is_file():
+                    signatures[path.relative_to(IMAGES_DIR).as_posix()] = signature
+        return signatures
+
+    def reload_assets(self):
+        """Applies changes to debuffs.json and images/ to the running categories.
+
+        Images whose mtime or size changed are dropped from the template bank
+        (here and in the worker processes) and from icon_pixmaps, so only they
+        are decoded again. Debuff definitions are diffed by name; unchanged ones
+        keep their dicts, categories whose selection now resolves differently
+        are reconfigured in place (see CategoryWindow.reconfigure), and icons
+        of changed definitions or images are redrawn. Nothing is restarted.
+        """
+        image_signatures = self.read_image_signatures()
+        changed_images = {name for name in image_signatures.keys() | self.image_signatures.keys()
+                          if image_signatures.get(name) != self.image_signatures.get(name)}
+        self.image_signatures = image_signatures
+        for filename in changed_images:
+            template_bank.invalidate(filename)
+            icon_pixmaps.invalidate(filename)
+        if changed_images and self.worker_pool is not None:
+            self.worker_pool.invalidate_templates(changed_images)
+
+        added, removed, changed = set(), set(), set()
+        debuffs_signature = file_signature(Path('debuffs.json'))
+        debuffs_reloaded = False
+        if debuffs_signature != self.debuffs_signature:
+            debuffs = self.read_debuffs()
+            if debuffs is None:
+                print("Keeping the loaded debuffs.") # Retried on the next change
+            else:
+                debuffs_reloaded = True
+                self.debuffs_signature = debuffs_signature
+                old = {d['name']: d for d in self.debuffs}
+                # Unchanged definitions keep their dicts (and their windows' icons)
+                self.debuffs = [old[d['name']] if old.get(d['name']) == d else d for d in debuffs]
+                new = {d['name']: d for d in self.debuffs}
+                added = new.keys() - old.keys()
+                removed = old.keys() - new.keys()
+                changed = {name for name in new.keys() & old.keys() if new[name] is not old[name]}
+
+        for window in self.category_windows:
+            if debuffs_reloaded:
+                debuffs = category_debuffs(window.category_config, self.debuffs)
+                if debuffs != window.debuffs: # Unchanged definitions were kept, so this is a real change
+                    window.reconfigure(debuffs)
+            redraw = [d['name'] for d in window.debuffs if d['name'] in changed or d['icon_image'] in changed_images]
+            if redraw:
+                window.refresh_icons(redraw)
+        if added or removed or changed or changed_images:
+            print(f"Reloaded debuffs: {len(added)} added, {len(removed)} removed, {len(changed)} changed; "
+                  f"{len(changed_images)} images changed")
+        if self.asset_watcher is not None:
+            self.watch_assets()
 
     def close_all(self):
         """Closes all category windows and exits the application."""
         print("Exiting application...")
+        print(f"Template bank: {template_bank.stats()}")
+        print(f"Capture: {self.capture_service.backend.stats()}")
         if self.tray_icon:
             self.tray_icon.hide()
+        self.settings_save_timer.stop()
+        self.asset_reload_timer.stop()
+        if self.settings_store.dirty:
+            self.write_settings() # Changes still in their quiet period, read while the windows are open
 
         # Make copies of lists to iterate over as closing modifies them
         windows_to_close = list(self.category_windows)
@@ -1467,6 +4842,17 @@ class DebuffTracker(QWidget):
                  print(f"Error closing window {window.category_name}: {e}")
 
         self.category_windows.clear() # Clear the list
+        self.settings_store.close() # Waits for the write
+        self.profiler.stop()
+        if self.metrics_timer is not None:
+            self.metrics_timer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.detection_scheduler.stop()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+        self.capture_service.close()
+        self.latency_tracer.close()
 
         # Ensure the application instance quits properly
         app_instance = QApplication.instance()
@@ -1477,12 +4863,153 @@ class DebuffTracker(QWidget):
              print("No QApplication instance found to quit.")
 
 
+# --- Headless Runner ---
+def run_headless(argv):
+    """`python main.py --headless ...`: runs the detection engines without Qt.
+
+    Reads settings.json and debuffs.json (without writing them back), feeds each
+    frame to every category's DetectionEngine in thread mode and prints detection
+    changes with their scores, then per-category tick timings. Frames are stamped
+    on a virtual clock at the fastest category's tick rate, so poll intervals
+    behave as they would live while the run goes as fast as it can. Pass --rate
+    to pace a live capture backend instead. A --replay of a recording uses the
+    recorded timestamps, so the same recording always gives the same results.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="main.py --headless", description="Run detection without the overlay")
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--source', help="Image or folder of images to read frames from (file capture backend)")
+    parser.add_argument('--origin', type=int, nargs=2, metavar=('X', 'Y'),
+                        help="Screen position of the frames' top-left corner (default: capture_origin)")
+    parser.add_argument('--backend', help="Capture backend instead of settings.json's capture_backend")
+    parser.add_argument('--frames', type=int, help="Frames to process (default: every file once, or 100)")
+    parser.add_argument('--replay', help="Recording directory to read frames from (replay capture backend)")
+    parser.add_argument('--rate', type=float, default=0.0, help="Ticks per second in real time (0 = virtual clock)")
+    parser.add_argument('--realtime', action='store_true', help="Replay at the recorded pace")
+    parser.add_argument('--record', help="Record the processed frames to this directory")
+    parser.add_argument('--category', action='append', help="Only run this category (repeatable)")
+    parser.add_argument('--quiet', action='store_true', help="Only print the summary")
+    parser.add_argument('--json', help="Also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        with open('settings.json') as f:
+            settings = json.load(f)
+        with open('debuffs.json') as f:
+            debuffs = json.load(f)
+    except Exception as e:
+        print(f"Error loading settings.json/debuffs.json: {e}")
+        return 1
+    global_settings = {**GLOBAL_SETTING_DEFAULTS, **{k: v for k, v in settings.items() if k != 'categories'}}
+    if args.replay:
+        global_settings['capture_backend'] = 'replay'
+        global_settings['capture_source'] = args.replay
+    elif args.source:
+        global_settings['capture_backend'] = 'file'
+        global_settings['capture_source'] = args.source
+    elif args.backend:
+        global_settings['capture_backend'] = args.backend
+    if args.origin:
+        global_settings['capture_origin'] = args.origin
+
+    capture_service = CaptureService(create_capture_backend(global_settings))
+    anchor_resolver = AnchorResolver(template_bank)
+    engines, timings = [], {}
+
+    def print_diff(diff):
+        for debuff, detected in diff.changes:
+            score = diff.scores[debuff]
+            print(f"[{frame_index}] {diff.category}: {debuff} {'detected' if detected else 'not detected'} "
+                  f"(score {score if score is not None else float('nan'):.3f})")
+
+    for category_config in settings.get('categories', []):
+        name = category_config.get('name')
+        if args.category and name not in args.category:
+            continue
+        engine = DetectionEngine(category_config, category_debuffs(category_config, debuffs), capture_service,
+                                 anchor_resolver, match_threads=category_config.get(
+                                     'match_threads', global_settings.get('match_threads', 1)))
+        if not args.quiet:
+            engine.subscribe(print_diff, lambda found, engine=engine: print(
+                f"[{frame_index}] {engine.category_name}: anchor {'found' if found else 'lost'}"))
+        engines.append(engine)
+        timings[engine] = []
+    if not engines:
+        print("No categories to run.")
+        return 1
+
+    backend = capture_service.backend
+    replay = isinstance(backend, ReplayCaptureBackend)
+    if args.frames is not None:
+        frame_count = args.frames
+    elif replay:
+        frame_count = backend.recording.frame_count
+    else:
+        frame_count = len(backend.frames) if isinstance(backend, FileCaptureBackend) else 100
+    tick_period = 1.0 / (args.rate or max(engine.tick_rate_hz for engine in engines))
+    print(f"Headless: {len(engines)} categories, {frame_count} frames, capture backend {backend.name}")
+    # Written here rather than by the capture service, which would store the raw grab times
+    recorder = FrameRecorder(args.record) if args.record else None
+
+    start = time.monotonic()
+    for frame_index in range(frame_count):
+        if args.rate:
+            time.sleep(max(start + frame_index * tick_period - time.monotonic(), 0.0))
+        frame = capture_service.get_frame(max_age=0)
+        if replay:
+            if args.realtime:
+                time.sleep(max(start + backend.timestamp - time.monotonic(), 0.0))
+            frame = CapturedFrame(backend.timestamp, frame.regions) # Recorded clock
+        elif not args.rate:
+            frame = CapturedFrame(frame_index * tick_period, frame.regions) # Virtual clock
+        if recorder is not None:
+            recorder.write(frame) # As processed, so replaying it sees the same timestamps and due sets
+        for engine in engines:
+            tick_start = time.perf_counter()
+            engine.process_frame(frame)
+            timings[engine].append((time.perf_counter() - tick_start) * 1000.0)
+    elapsed = time.monotonic() - start
+
+    summary = {'frames': frame_count, 'seconds': round(elapsed, 3), 'capture': backend.stats(), 'categories': {}}
+    for engine in engines:
+        ticks = sorted(timings[engine])
+        summary['categories'][engine.category_name] = {
+            'mean_ms': round(sum(ticks) / len(ticks), 3) if ticks else 0.0,
+            'p50_ms': round(ticks[len(ticks) // 2], 3) if ticks else 0.0,
+            'p95_ms': round(ticks[min(int(len(ticks) * 0.95), len(ticks) - 1)], 3) if ticks else 0.0,
+            'max_ms': round(ticks[-1], 3) if ticks else 0.0,
+            'anchor_found': engine.anchor_found,
+            'detected': sorted(name for name, detected in engine.last_detection_state.items() if detected),
+            'counters': engine.detection_stats(),
+        }
+        engine.stop()
+    capture_service.close()
+    if recorder is not None:
+        recorder.close()
+        print(f"Recorded {recorder.frames} frames to {recorder.path}")
+
+    print(f"\n{frame_count} frames in {elapsed:.2f} s, capture: {summary['capture']}")
+    for name, result in summary['categories'].items():
+        counters = result['counters']
+        print(f"{name}: tick mean {result['mean_ms']} ms, p50 {result['p50_ms']}, p95 {result['p95_ms']}, "
+              f"max {result['max_ms']} | matches full {counters['full_matches']}, partial {counters['partial_matches']}, "
+              f"skipped {counters['skipped_matches']}, not due {counters['deferred_matches']} | "
+              f"detected {result['detected']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
 if __name__ == "__main__":
     # Ensure images directory exists
     img_dir = Path("images")
     img_dir.mkdir(exist_ok=True)
     print(f"Image directory: {img_dir.resolve()}")
 
+    if '--headless' in sys.argv:
+        sys.exit(run_headless(sys.argv[1:]))
+
     app = QApplication(sys.argv)
     # Import QFont here if needed for default icon
     from PyQt5.QtGui import QFont